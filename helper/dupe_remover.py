@@ -1,28 +1,33 @@
 import argparse
+import os
 import sys
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from minish_parser import LABEL_LINE
+
 def main():
     parser = argparse.ArgumentParser(description='Minterm reduction with ASP')
     parser.add_argument('file', nargs='?', type=argparse.FileType('r'),
                         default=sys.stdin, help="TXT File (default: stdin)")
     args = parser.parse_args()
 
+    # Lines are read one at a time, every minterm keeps the lines it was seen at
+    seen = {}
     try:
-        fcont = args.file.read().split('\n')
+        for idx, line in enumerate(args.file):
+            minterm = line.strip()
+            if not LABEL_LINE.match(minterm):
+                continue
+            for first in seen.get(minterm, []):
+                print ("DUPE AT {0}<->{1}: {2}".format(first+1, idx+1, minterm))
+            seen.setdefault(minterm, []).append(idx)
     except Exception as exc:
         print("error parsing file:", args.file.name)
         print(exc)
         return 1
 
-    dupe_count = 0
-    for idx, linex in enumerate(fcont):
-        for idy,liney in enumerate(fcont[idx+1:]):
-            if linex == liney:
-                print ("DUPE AT {0}<->{1}: {2}".format(idx+1, idx+idy+2, linex))
-                dupe_count += 1
-
-    print("OG Minterms: {0}".format(len(fcont)-dupe_count))
+    print("Unique Minterms: {0}".format(len(seen)))
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
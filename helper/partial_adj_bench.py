@@ -0,0 +1,57 @@
+import argparse
+import os
+import random
+import sys
+import time
+from itertools import combinations
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from minish_hat import label_to_octal, check_partial_adj, partial_adj_pairs
+
+def random_terms(atoms, size, aggr):
+    terms = set()
+    while len(terms) < size:
+        label = ""
+        for _ in range(atoms):
+            if random.random() < aggr:
+                label += random.choice('zox')
+            else:
+                label += random.choice('012')
+        terms.add(label_to_octal(label))
+    return list(terms)
+
+def main():
+    parser = argparse.ArgumentParser(description='Partial adjacency comparisons: all pairs vs signature index')
+    parser.add_argument('atoms', metavar='A', type=int,
+                    help='number of atoms of the terms')
+    parser.add_argument('-s', '--sizes', type=int, nargs='+', default=[100, 200, 400, 800, 1600],
+                        help='term counts to measure')
+    parser.add_argument('-x', '--aggr', type=float, default=0.3,
+                        help="share of 'z', 'o' and 'x' digits, 0.3 by default")
+    parser.add_argument('--seed', type=int, default=0,
+                        help='random seed, 0 by default')
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    print("{0:>8} {1:>12} {2:>12} {3:>8} {4:>10} {5:>10}".format(
+            "terms", "all pairs", "candidates", "found", "all (s)", "index (s)"))
+    for size in args.sizes:
+        keys = random_terms(args.atoms, size, args.aggr)
+
+        pre_all = time.time()
+        found_all = [ p for p in combinations(keys, 2) if check_partial_adj(*p) ]
+        post_all = time.time()
+        candidates = partial_adj_pairs(keys)
+        found_index = [ p for p in candidates if check_partial_adj(*p) ]
+        post_index = time.time()
+
+        if found_all != found_index:
+            print("Index missed partial adjacencies for {0} terms".format(size))
+            return 1
+        print("{0:>8} {1:>12} {2:>12} {3:>8} {4:>10.4f} {5:>10.4f}".format(
+                size, size*(size-1)//2, len(candidates), len(found_all),
+                post_all-pre_all, post_index-post_all))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
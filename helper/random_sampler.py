@@ -1,5 +1,10 @@
+import os
 import random
 import argparse
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from minish_bench import random_labels, random_program
 
 def ternary (n):
     if n == 0:
@@ -18,13 +23,36 @@ def main():
                     help='sample size')
     parser.add_argument('-o', '--out', metavar='O', type=str,
                         help='optional route for the output minterm text file')
+    parser.add_argument('-m', '--mode', choices=['minterms', 'labels', 'program'], default='minterms',
+                        help='uniform minterms, labels with aggregated digits or a logic program, minterms by default')
+    parser.add_argument('-x', '--xshare', type=float, default=0.3,
+                        help="share of 'x' digits in the labels, 0.3 by default")
+    parser.add_argument('-z', '--zoshare', type=float, default=0.1,
+                        help="share of 'z' and 'o' digits in the labels, 0.1 by default")
+    parser.add_argument('-l', '--length', type=int, default=3,
+                        help='maximum atoms in a rule of the program, 3 by default')
     args = parser.parse_args()
 
     if args.out != None:
         out_file = args.out
+    elif args.mode == 'program':
+        out_file = "./input/rnprogram_{0}_{1}.lp".format(args.atoms, args.size)
+    elif args.mode == 'labels':
+        out_file = "./input/rnlabels_{0}_{1}.txt".format(args.atoms, args.size)
     else:
         out_file = "./input/rnsample_{0}_{1}.txt".format(args.atoms, args.size)
 
+    if args.mode != 'minterms':
+        if args.mode == 'labels':
+            lines = random_labels(args.atoms, args.size, args.xshare, args.zoshare, random.Random())
+        else:
+            lines = random_program(args.atoms, args.size, args.length, random.Random())
+        if len(lines) < args.size:
+            print('Only {0} distinct rules could be generated.'.format(len(lines)))
+        with open(out_file, "w") as file:
+            file.write("\n".join(lines) + "\n")
+        return
+
     sample = []
     try:
         rn = range(0, 3**args.atoms)
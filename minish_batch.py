@@ -1,78 +1,233 @@
 import os
 import argparse
+import contextlib
+import csv
+import json
+import multiprocessing
+import resource
+import signal
 import sys
-from minish_hat import main as minimize
+import time
+import traceback
+from multiprocessing.connection import wait
+from minish_hat import Minimizer, format_result, format_stages
+from minish_parser import format_throughput
+from minish_solver import available_threads
 
-def main(arguments):
-    parser = argparse.ArgumentParser(description='Minish-HAT but for directories')
-    parser.add_argument('directory', type=str, help="Directory containing any type of valid input for minish-HAT")
-    parser.add_argument('-o', '--out', type=str, default="minish.log", help="Output File, minish.log by default")
-    args = parser.parse_args(arguments)
+def run_file(path, memory, options, conn):
+    # Own process group, so that stopping the file also stops the processes
+    # it starts, as the clingo searches of a deadline or the pair loop workers
+    os.setpgid(0, 0)
+    if memory is not None:
+        limit = memory*1024*1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    log = ""
+    stats = None
+    try:
+        with Minimizer(**options) as minimizer:
+            result = minimizer.minimize_file(path)
+        if result is None:
+            status = "no rules"
+            log = "Program has no fundamental rules\n"
+        else:
+            status = "ok"
+            stats = result.summary()
+            log = format_throughput(result.parse) + "\n"
+            log += format_stages(result.stats) + format_result(result, minimizer.args)
+    except MemoryError:
+        status = "memory"
+    except Exception:
+        status = "error"
+        log += traceback.format_exc()
+    conn.send((status, stats, log))
+    conn.close()
 
-    orig_stdout = sys.stdout
-    outlog = open(args.out, 'w')
+def set_group(proc):
+    # Also set from the parent, the file may be stopped before it sets it
+    try:
+        os.setpgid(proc.pid, proc.pid)
+    except OSError:
+        pass
 
-    sys.stdout = outlog
+def kill_group(proc):
+    try:
+        os.killpg(proc.pid, signal.SIGTERM)
+    except OSError:
+        proc.terminate()
 
-    suberror = 0
-    suberrorcases = []
-    eqerror = 0
-    eqerrorcases = []
+def run_files(paths, options, args):
+    # Every file runs in its own process with the Minimizer options, at most
+    # args.jobs at a time. Yields (index, status, stats, log, wall time) as
+    # files finish, closing it stops the files still running
+    pending = list(enumerate(paths))[::-1]
+    running = {}
+    try:
+        while len(pending) > 0 or len(running) > 0:
+            while len(pending) > 0 and len(running) < args.jobs:
+                i, path = pending.pop()
+                recv, send = multiprocessing.Pipe(duplex=False)
+                proc = multiprocessing.Process(target=run_file, args=(path, args.memory, options, send))
+                proc.start()
+                set_group(proc)
+                send.close()
+                running[recv] = (i, proc, time.time())
+            timeout = None
+            if args.timeout is not None:
+                timeout = max(0, min(start for i, proc, start in running.values()) + args.timeout - time.time())
+            ready = wait(list(running.keys()), timeout)
+            now = time.time()
+            for conn, (i, proc, start) in list(running.items()):
+                if conn in ready:
+                    try:
+                        status, stats, log = conn.recv()
+                    except EOFError:
+                        # Killed before reporting, usually by the memory limit
+                        kill_group(proc)
+                        status, stats, log = "crashed", None, ""
+                elif args.timeout is not None and now-start >= args.timeout:
+                    kill_group(proc)
+                    status, stats, log = "timeout", None, ""
+                else:
+                    continue
+                proc.join()
+                conn.close()
+                del running[conn]
+                yield i, status, stats, log, now-start
+    finally:
+        # Stopped early, as by a Ctrl-C, which does not reach the process
+        # groups of the files
+        for conn, (i, proc, start) in running.items():
+            kill_group(proc)
+            proc.join()
+            conn.close()
+
+def file_entry(i, path, log, status):
+    entry = ""
+    entry += '-'*40 + "\n"
+    entry += "[{0}]".format(i) + path + ":\n"
+    entry += "ORIGINAL FILE:\n"
+    with open(path, 'r') as fin:
+        entry += fin.read() + "\n"
+    entry += '-'*40 + "\n"
+    entry += "MINIMAL PROGRAM:\n"
+    entry += log
+    if status not in ("ok", "no rules"):
+        entry += "[BATCH] {0}\n".format(status.upper())
+    entry += '-'*40 + "\n"
+    return entry
+
+def time_aggregates(records):
     timestats = { "nrules" : {}, "natoms" : {} }
-    files = [x for x in os.listdir(args.directory) if x.endswith(".lp") or x.endswith(".txt")]
-    for i,f in enumerate(files):
-        print('-'*40)
-        print("[{0}]".format(i) +args.directory + "/" + f + ":")
-        print("ORIGINAL FILE:")
-        with open(args.directory + "/" + f, 'r') as fin:
-            print(fin.read())
-        print('-'*40)
-        print("MINIMAL PROGRAM:")
-        stats = minimize([args.directory + "/" + f, "-te", "-ts", "-t"])
-        print('-'*40)
-        if stats != None:
-            if stats['errorsub'] != 0:
-                suberror += 1
-                suberrorcases += [i]
-            if stats['erroreq'] != 0:
-                eqerror += 1
-                eqerrorcases += [i]
-            if not stats['rules'] in timestats['nrules'].keys():
-                timestats['nrules'].update({ stats['rules'] : [stats['time']] })
-            else:
-                timestats['nrules'][stats['rules']] += [stats['time']]
-            if not stats['atoms'] in timestats['natoms'].keys():
-                timestats['natoms'].update({ stats['atoms'] : [stats['time']] })
-            else:
-                timestats['natoms'][stats['atoms']] += [stats['time']]
-    nfiles = len(files)
+    for record in records:
+        if record['status'] != "ok":
+            continue
+        timestats['nrules'].setdefault(record['rules'], []).append(record['time'])
+        timestats['natoms'].setdefault(record['atoms'], []).append(record['time'])
+    rows = []
+    for group, key in (("nrules", "rules"), ("natoms", "atoms")):
+        for value, times in sorted(timestats[group].items()):
+            rows += [ [group, value, len(times), sum(times)/len(times), min(times), max(times)] ]
+    return rows
+
+def summary(records):
+    finished = [ r for r in records if r['status'] in ("ok", "no rules") ]
+    failed = [ r for r in records if not r['status'] in ("ok", "no rules") ]
+    eqerrorcases = [ r for r in finished if r.get('erroreq', 0) != 0 ]
+    suberrorcases = [ r for r in finished if r.get('errorsub', 0) != 0 ]
+    nfiles = len(finished)
 
     restr = ""
     restr += '-'*40 + "\n"
     restr += "RESULTS" + "\n"
     restr += '-'*40 + "\n"
 
-    restr += "{0} out of {1} ({2:.2f}%) programs are strongly equivalent\n".format(
-                nfiles-eqerror, nfiles, ((nfiles-eqerror)/nfiles)*100)
-    if len(eqerrorcases) > 0:
-        restr += "Not Strongly Equivalent Cases:\n"
-        restr += ", ".join(["[{0}] '{1}'".format(i,files[i]) for i in eqerrorcases]) + "\n"
-    restr += "{0} out of {1} ({2:.2f}%) programs are properly smaller\n".format(
-                nfiles-suberror, nfiles, ((nfiles-suberror)/nfiles)*100)
-    if len(suberrorcases) > 0:
-        restr += "Not Properly Smaller Cases:\n"
-        restr += ", ".join(["[{0}] '{1}'".format(i,files[i]) for i in suberrorcases]) + "\n"
+    if nfiles > 0:
+        restr += "{0} out of {1} ({2:.2f}%) programs are strongly equivalent\n".format(
+                    nfiles-len(eqerrorcases), nfiles, ((nfiles-len(eqerrorcases))/nfiles)*100)
+        if len(eqerrorcases) > 0:
+            restr += "Not Strongly Equivalent Cases:\n"
+            restr += ", ".join(["[{0}] '{1}'".format(r['index'],r['file']) for r in eqerrorcases]) + "\n"
+        restr += "{0} out of {1} ({2:.2f}%) programs are properly smaller\n".format(
+                    nfiles-len(suberrorcases), nfiles, ((nfiles-len(suberrorcases))/nfiles)*100)
+        if len(suberrorcases) > 0:
+            restr += "Not Properly Smaller Cases:\n"
+            restr += ", ".join(["[{0}] '{1}'".format(r['index'],r['file']) for r in suberrorcases]) + "\n"
+    besteffort = [ r for r in finished if not r.get('optimal', True) ]
+    if len(besteffort) > 0:
+        restr += "{0} out of {1} programs reached the deadline with a best-effort solution:\n".format(
+                    len(besteffort), nfiles)
+        restr += ", ".join(["[{0}] '{1}'".format(r['index'],r['file']) for r in besteffort]) + "\n"
+    if len(failed) > 0:
+        restr += "{0} out of {1} programs did not finish:\n".format(len(failed), len(records))
+        restr += ", ".join(["[{0}] '{1}' ({2})".format(r['index'],r['file'],r['status']) for r in failed]) + "\n"
 
+    rows = time_aggregates(records)
+    if len(rows) > 0:
+        restr += "Average times:\n"
+        for group, value, count, mean, mintime, maxtime in rows:
+            restr += "{0}={1}: {2:.5f} s ({3} files, min {4:.5f} s, max {5:.5f} s)\n".format(
+                        group, value, mean, count, mintime, maxtime)
+    return restr
 
-    print(restr)
+def main(arguments):
+    parser = argparse.ArgumentParser(description='Minish-HAT but for directories')
+    parser.add_argument('directory', type=str, help="Directory containing any type of valid input for minish-HAT")
+    parser.add_argument('-o', '--out', type=str, default="minish.log", help="Output File, minish.log by default")
+    parser.add_argument('-r', '--results', type=str, default="minish.jsonl",
+                        help="Results File with one JSON record per input file, minish.jsonl by default")
+    parser.add_argument('-c', '--csv', type=str, default="minish.csv",
+                        help="CSV File with the average times by rules and atoms, minish.csv by default")
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help="Files minimized at the same time, 1 by default")
+    parser.add_argument('-to', '--timeout', type=float, default=None,
+                        help="Wall-clock limit in seconds for each file, none by default")
+    parser.add_argument('-dl', '--deadline', type=float, default=None,
+                        help="Time budget in seconds of the minimization of each file, past it the best solution so far is kept, none by default")
+    parser.add_argument('-mem', '--memory', type=int, default=None,
+                        help="Memory limit in MB for each file, none by default")
+    parser.add_argument('-th', '--threads', type=int, default=0,
+                        help="Clingo threads of every file, 0 by default to share the cores among the jobs")
+    parser.add_argument('-ch', '--cache', type=str, default=None,
+                        help="Cache directory shared by every file, no cache by default")
+    args = parser.parse_args(arguments)
 
-    sys.stdout = orig_stdout
-    outlog.close()
+    if args.jobs < 1:
+        parser.error("jobs must be at least 1")
 
-    print(restr)
+    files = sorted([x for x in os.listdir(args.directory) if x.endswith(".lp") or x.endswith(".txt")])
+    paths = [ args.directory + "/" + f for f in files ]
 
-    #TODO: Average times for atoms and rules and display somehow
-    #      Maybe tables, maybe plot them, maybe export a csv
+    # Log entries and records are written in file order as soon as possible
+    records = [ None ] * len(files)
+    entries = [ None ] * len(files)
+    written = 0
+    with open(args.out, 'w') as outlog, open(args.results, 'w') as outresults:
+        threads = args.threads or available_threads(args.jobs)
+        options = { 'testeq' : True, 'eqmode' : 'query', 'testsub' : True, 'cache' : args.cache,
+                    'threads' : threads, 'deadline' : args.deadline }
+        with contextlib.closing(run_files(paths, options, args)) as runs:
+            for i, status, stats, log, wall in runs:
+                record = { "index" : i, "file" : files[i], "status" : status, "wall" : wall }
+                if stats is not None:
+                    record.update(stats)
+                records[i] = record
+                entries[i] = file_entry(i, paths[i], log, status)
+                print("[{0}] {1}: {2} ({3:.2f} s)".format(i, files[i], status, wall))
+                while written < len(files) and records[written] is not None:
+                    outlog.write(entries[written])
+                    outresults.write(json.dumps(records[written]) + "\n")
+                    entries[written] = None
+                    written += 1
+
+        restr = summary(records)
+        outlog.write(restr + "\n")
+
+    with open(args.csv, 'w', newline='') as outcsv:
+        writer = csv.writer(outcsv)
+        writer.writerow(["group", "value", "files", "mean", "min", "max"])
+        writer.writerows(time_aggregates(records))
+
+    print(restr)
 
 
 if __name__ == "__main__":
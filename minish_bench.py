@@ -0,0 +1,287 @@
+import os
+import argparse
+import contextlib
+import json
+import random
+import shutil
+import sys
+import tempfile
+from itertools import product
+from minish_batch import run_files
+
+BENCH_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench")
+
+def random_label(atoms, xshare, zoshare, rnd):
+    label = ""
+    for _ in range(atoms):
+        r = rnd.random()
+        if r < xshare:
+            label += 'x'
+        elif r < xshare + zoshare:
+            label += rnd.choice('zo')
+        else:
+            label += rnd.choice('012')
+    return label
+
+def random_labels(atoms, rules, xshare, zoshare, rnd):
+    # Distinct labels, fewer if the signature runs out of them first
+    labels = []
+    seen = set()
+    tries = 0
+    while len(labels) < rules and tries < 100*rules:
+        tries += 1
+        label = random_label(atoms, xshare, zoshare, rnd)
+        if label.count('x') == atoms or label in seen:
+            continue
+        seen.add(label)
+        labels += [ label ]
+    return labels
+
+def random_rule(atomnames, length, rnd):
+    # Every atom of the rule goes to one of the four parts, no atom twice
+    head, body = [], []
+    for atom in rnd.sample(atomnames, length):
+        part = rnd.choice(['phead', 'nhead', 'pbody', 'nbody'])
+        if part == 'phead':
+            head += [ atom ]
+        elif part == 'nhead':
+            head += [ "not " + atom ]
+        elif part == 'pbody':
+            body += [ atom ]
+        else:
+            body += [ "not " + atom ]
+    if len(body) == 0:
+        return "; ".join(head) + "."
+    if len(head) == 0:
+        return ":- " + ", ".join(body) + "."
+    return "; ".join(head) + " :- " + ", ".join(body) + "."
+
+def random_program(atoms, rules, maxlength, rnd):
+    atomnames = [ "a{0}".format(i) for i in range(atoms) ]
+    program = []
+    seen = set()
+    tries = 0
+    while len(program) < rules and tries < 100*rules:
+        tries += 1
+        rule = random_rule(atomnames, rnd.randint(1, min(maxlength, atoms)), rnd)
+        if rule in seen:
+            continue
+        seen.add(rule)
+        program += [ rule ]
+    return program
+
+def bench_cases(args):
+    cases = []
+    for kind, atoms, rules, cover, seed in product(args.kinds, args.atoms, args.rules,
+                                                   args.covers, range(args.seeds)):
+        if kind == 'labels':
+            name = "labels-a{0}-r{1}-x{2}-z{3}-{4}-s{5}".format(atoms, rules, args.xshare,
+                                                                args.zoshare, cover, seed)
+        else:
+            name = "program-a{0}-r{1}-l{2}-{3}-s{4}".format(atoms, rules, args.length, cover, seed)
+        cases += [ { 'name' : name, 'kind' : kind, 'atoms' : atoms, 'rules' : rules,
+                     'cover' : cover, 'seed' : seed } ]
+    return cases
+
+def write_case(directory, case, args):
+    # The same case always gets the same input, whatever the rest of the grid
+    rnd = random.Random("{0}-{1}-{2}-{3}".format(case['kind'], case['atoms'], case['rules'], case['seed']))
+    if case['kind'] == 'labels':
+        lines = random_labels(case['atoms'], case['rules'], args.xshare, args.zoshare, rnd)
+        path = os.path.join(directory, case['name'] + ".txt")
+    else:
+        lines = random_program(case['atoms'], case['rules'], args.length, rnd)
+        path = os.path.join(directory, case['name'] + ".lp")
+    with open(path, 'w') as fout:
+        fout.write("\n".join(lines) + "\n")
+    return path
+
+def case_options(case, args):
+    return { 'testeq' : True, 'eqmode' : 'query', 'testsub' : True,
+             'hybridcover' : case['cover'] == 'hybrid', 'tracemem' : args.tracemem }
+
+def case_record(case, status, stats, wall):
+    record = dict(case, status=status, wall=wall)
+    if stats is None:
+        return record
+    metrics = stats['metrics']
+    stages = {}
+    for span in metrics['spans']:
+        stages[span['name']] = stages.get(span['name'], 0) + span['time']
+    solver = {}
+    for call in metrics['solver']:
+        solver[call['encoding']] = solver.get(call['encoding'], 0) + call['time']
+    record.update({
+        'time'        : stats['time'],
+        'stages'      : stages,
+        'solver'      : solver,
+        'max_rss'     : max([ span['max_rss'] for span in metrics['spans'] ] + [0]),
+        'peak_memory' : max([ span.get('peak_memory', 0) for span in metrics['spans'] ] + [0]),
+        'counts'      : dict(metrics['counters'], terms=stats['terms'], primes=stats['primes'],
+                             minsolcount=stats['minsolcount'], size=stats['size'],
+                             erroreq=stats['erroreq'], errorsub=stats['errorsub']),
+    })
+    return record
+
+def record_times(record):
+    times = { 'time' : record['time'] }
+    for name, t in record['stages'].items():
+        times["stage " + name] = t
+    for name, t in record['solver'].items():
+        times["solver " + name] = t
+    return times
+
+# Counts of a case that do not depend on the machine
+BASELINE_COUNTS = ('terms', 'primes', 'minsolcount', 'size', 'erroreq', 'errorsub')
+
+def baseline_record(record):
+    counts = {}
+    if record['status'] == "ok":
+        counts = { name : record['counts'][name] for name in BASELINE_COUNTS }
+    return { 'name' : record['name'], 'status' : record['status'], 'counts' : counts }
+
+def compare_counts(records, baseline):
+    base = { record['name'] : record for record in baseline['records'] }
+    changes = []
+    for record in records:
+        old = base.get(record['name'])
+        if old is None:
+            continue
+        if record['status'] != old['status']:
+            changes += [ "{0}: status {1} -> {2}".format(record['name'], old['status'], record['status']) ]
+            continue
+        if record['status'] != "ok":
+            continue
+        for name in BASELINE_COUNTS:
+            if record['counts'][name] != old['counts'][name]:
+                changes += [ "{0}: {1} {2} -> {3}".format(record['name'], name, old['counts'][name], record['counts'][name]) ]
+    return changes
+
+def compare_times(records, baseline, tolerance, mindiff):
+    # A time is a regression when it grows past the tolerance and by more than
+    # mindiff seconds, so that the noise of small cases is not reported
+    base = { record['name'] : record for record in baseline['records'] }
+    regressions = []
+    for record in records:
+        old = base.get(record['name'])
+        if old is None or record['status'] != "ok" or old['status'] != "ok":
+            continue
+        oldtimes = record_times(old)
+        for name, t in sorted(record_times(record).items()):
+            if name in oldtimes and t > oldtimes[name]*(1+tolerance) and t-oldtimes[name] > mindiff:
+                regressions += [ "{0}: {1} {2:.5f} s -> {3:.5f} s".format(record['name'], name, oldtimes[name], t) ]
+    return regressions
+
+def main(arguments):
+    parser = argparse.ArgumentParser(description='Minish-HAT scaling benchmark on generated inputs')
+    parser.add_argument('-k', '--kinds', choices=['labels', 'program'], nargs='+', default=['labels', 'program'],
+                        help="Generated inputs, labels and/or logic programs, both by default")
+    parser.add_argument('-a', '--atoms', type=int, nargs='+', default=[3, 4, 5],
+                        help="Atom counts of the grid, 3 4 5 by default")
+    parser.add_argument('-r', '--rules', type=int, nargs='+', default=[4, 8, 16],
+                        help="Rule counts of the grid, 4 8 16 by default")
+    parser.add_argument('-cv', '--covers', choices=['hybrid', 'full'], nargs='+', default=['hybrid', 'full'],
+                        help="Covers of the grid, hybrid and full by default")
+    parser.add_argument('-s', '--seeds', type=int, default=1,
+                        help="Inputs generated for every grid point, 1 by default")
+    parser.add_argument('-x', '--xshare', type=float, default=0.3,
+                        help="Share of 'x' digits in the labels, 0.3 by default")
+    parser.add_argument('-z', '--zoshare', type=float, default=0.1,
+                        help="Share of 'z' and 'o' digits in the labels, 0.1 by default")
+    parser.add_argument('-l', '--length', type=int, default=3,
+                        help="Maximum atoms in a rule of the programs, 3 by default")
+    parser.add_argument('-o', '--out', type=str, default="bench.json",
+                        help="Results File, bench.json by default")
+    parser.add_argument('-b', '--baseline', type=str, default=os.path.join(BENCH_DIR, "baseline.json"),
+                        help="Baseline of the counts of every case to compare with, bench/baseline.json by default")
+    parser.add_argument('-sc', '--save-counts', action='store_true', default=False,
+                        help="Store the counts as the new baseline instead of comparing")
+    parser.add_argument('-tb', '--time-baseline', type=str, default=os.path.join(BENCH_DIR, "times.json"),
+                        help="Local baseline of the times of this machine, bench/times.json by default")
+    parser.add_argument('-sb', '--save-baseline', action='store_true', default=False,
+                        help="Store the times as the new local baseline instead of comparing")
+    parser.add_argument('-tol', '--tolerance', type=float, default=0.5,
+                        help="Allowed relative time increase, 0.5 by default")
+    parser.add_argument('-md', '--mindiff', type=float, default=0.05,
+                        help="Smallest time increase in seconds reported, 0.05 by default")
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help="Cases run at the same time, 1 by default")
+    parser.add_argument('-to', '--timeout', type=float, default=300,
+                        help="Wall-clock limit in seconds for each case, 300 by default")
+    parser.add_argument('-mem', '--memory', type=int, default=None,
+                        help="Memory limit in MB for each case, none by default")
+    parser.add_argument('-tm', '--tracemem', action='store_true', default=False,
+                        help="Trace the peak Python memory of every stage")
+    args = parser.parse_args(arguments)
+
+    if args.jobs < 1:
+        parser.error("jobs must be at least 1")
+
+    cases = bench_cases(args)
+    directory = tempfile.mkdtemp(prefix="minish_bench")
+    records = [ None ] * len(cases)
+    try:
+        paths = [ write_case(directory, case, args) for case in cases ]
+        # Cases differ in their options, so they are run grouped by them
+        groups = {}
+        for i, case in enumerate(cases):
+            options = case_options(case, args)
+            groups.setdefault(tuple(sorted(options.items())), []).append(i)
+        for options, indexes in groups.items():
+            with contextlib.closing(run_files([ paths[i] for i in indexes ], dict(options), args)) as runs:
+                for j, status, stats, log, wall in runs:
+                    i = indexes[j]
+                    records[i] = case_record(cases[i], status, stats, wall)
+                    if status == "ok":
+                        print("{0}: {1:.5f} s, {2} terms, {3} primes, {4:.1f} MB".format(
+                                cases[i]['name'], records[i]['time'], records[i]['counts']['terms'],
+                                records[i]['counts']['primes'], records[i]['max_rss']/(1024*1024)))
+                    else:
+                        print("{0}: {1}".format(cases[i]['name'], status))
+    finally:
+        shutil.rmtree(directory)
+
+    grid = { k : v for k, v in vars(args).items()
+             if not k in ('out', 'baseline', 'save_counts', 'time_baseline', 'save_baseline') }
+    results = { 'grid' : grid, 'records' : records }
+    with open(args.out, 'w') as fout:
+        json.dump(results, fout, indent=1)
+
+    # The counts baseline is shared, times only mean something on the machine
+    # they were measured on and stay in a local baseline
+    saved = [ (args.save_counts, args.baseline,
+               { 'grid' : grid, 'records' : [ baseline_record(r) for r in records ] }),
+              (args.save_baseline, args.time_baseline, results) ]
+    for save, path, content in saved:
+        if save:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            with open(path, 'w') as fout:
+                json.dump(content, fout, indent=1)
+            print("Baseline saved to {0}".format(path))
+    if args.save_counts or args.save_baseline:
+        return 0
+
+    changes = []
+    regressions = []
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r') as fin:
+            changes = compare_counts(records, json.load(fin))
+    else:
+        print("No baseline at {0}".format(args.baseline))
+    if os.path.exists(args.time_baseline):
+        with open(args.time_baseline, 'r') as fin:
+            regressions = compare_times(records, json.load(fin), args.tolerance, args.mindiff)
+    else:
+        print("No time baseline at {0}, save one with -sb".format(args.time_baseline))
+    for line in changes:
+        print("[CHANGED] " + line)
+    for line in regressions:
+        print("[REGRESSION] " + line)
+    if len(changes) == 0 and len(regressions) == 0:
+        print("No changes or regressions against the baselines")
+        return 0
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
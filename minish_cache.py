@@ -0,0 +1,74 @@
+import hashlib
+import json
+import os
+import tempfile
+
+# Bump when the stored entries change meaning
+CACHE_VERSION = 1
+
+def cache_key(terms, atomcount):
+    # Same function, same key: the order and repetitions of the terms do not matter
+    canon = json.dumps([CACHE_VERSION, atomcount, sorted(set(terms))])
+    return hashlib.sha256(canon.encode()).hexdigest()
+
+def cover_key(hybridcover, minmode=None, all=True):
+    # Fused hybrid covers only keep the best ones for minmode
+    if not hybridcover:
+        return "full"
+    if minmode is None:
+        return "hybrid"
+    return "hybrid-{0}-{1}".format(minmode, "all" if all else "one")
+
+def result_key(covkey, minmode, all):
+    return "{0}-{1}-{2}".format(covkey, minmode, "all" if all else "one")
+
+def entry_path(directory, key):
+    return os.path.join(directory, key + ".json")
+
+def read_entry(directory, key):
+    # Missing or half-evicted entries are plain misses
+    path = entry_path(directory, key)
+    try:
+        with open(path, 'r') as fin:
+            entry = json.load(fin)
+        os.utime(path)
+    except (OSError, ValueError):
+        return {}
+    return entry
+
+def write_entry(directory, key, entry, max_size):
+    # Entries are replaced atomically, so concurrent workers only ever see
+    # whole files. The last writer of the same key wins
+    os.makedirs(directory, exist_ok=True)
+    fd, tmppath = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w') as fout:
+            json.dump(entry, fout)
+        os.replace(tmppath, entry_path(directory, key))
+    except OSError:
+        if os.path.exists(tmppath):
+            os.unlink(tmppath)
+        return
+    evict(directory, max_size)
+
+def evict(directory, max_size):
+    # Least recently used entries go first, reads touch their entry
+    entries = []
+    total = 0
+    for name in os.listdir(directory):
+        if not name.endswith(".json"):
+            continue
+        try:
+            st = os.stat(os.path.join(directory, name))
+        except OSError:
+            continue
+        entries += [ (st.st_mtime, st.st_size, name) ]
+        total += st.st_size
+    for mtime, size, name in sorted(entries):
+        if total <= max_size:
+            break
+        try:
+            os.unlink(os.path.join(directory, name))
+        except OSError:
+            pass
+        total -= size
@@ -0,0 +1,250 @@
+# Covers of a set of elements by a list of sets, both as int bitsets. Element
+# e is bit e of every mask and set j is bit j of the allowed masks. The
+# searches return lists of set positions, each cover once. A deadline, as a
+# time.time() value, stops them with the covers found so far
+import time
+
+def expired(deadline):
+    return deadline is not None and time.time() > deadline
+
+def element_sets(masks, width):
+    # Positions of the sets containing every element
+    index = [ [] for e in range(width) ]
+    for j, mask in enumerate(masks):
+        m = mask
+        while m:
+            low = m & -m
+            index[low.bit_length()-1].append(j)
+            m ^= low
+    return index
+
+def allowed_candidates(index, e, allowed):
+    return [ j for j in index[e] if allowed >> j & 1 ]
+
+def branch_element(index, uncovered, allowed):
+    # Uncovered element with the fewest allowed sets, its candidates are the
+    # branches of the search
+    best = None
+    u = uncovered
+    while u:
+        low = u & -u
+        e = low.bit_length()-1
+        cands = allowed_candidates(index, e, allowed)
+        if best is None or len(cands) < len(best):
+            best = cands
+            if len(best) < 2:
+                break
+        u ^= low
+    return best
+
+def lower_bound(masks, index, uncovered, allowed):
+    # Elements no set covers together need a set each
+    bound = 0
+    u = uncovered
+    while u:
+        e = (u & -u).bit_length()-1
+        for j in allowed_candidates(index, e, allowed):
+            u &= ~masks[j]
+        u &= ~(1 << e)
+        bound += 1
+    return bound
+
+def undominated(masks):
+    # Sets not contained in another set, one of every group of equal sets
+    keep = 0
+    for j, mask in enumerate(masks):
+        if not any((mask & ~other == 0 and (mask != other or k < j))
+                   for k, other in enumerate(masks) if k != j):
+            keep |= 1 << j
+    return keep
+
+def greedy_cover(masks, index, uncovered, allowed):
+    chosen = []
+    while uncovered:
+        cands = allowed_candidates(index, (uncovered & -uncovered).bit_length()-1, allowed)
+        if len(cands) == 0:
+            return None
+        j = max(cands, key=lambda j: bin(masks[j] & uncovered).count("1"))
+        chosen += [ j ]
+        uncovered &= ~masks[j]
+    return chosen
+
+def bounded_covers(masks, index, uncovered, allowed, limit, found, first=False,
+                   deadline=None):
+    # Covers of at most limit sets, stops at the first one with first
+    chosen = []
+    def search(uncovered, allowed):
+        if uncovered == 0:
+            found.append(list(chosen))
+            return first
+        if expired(deadline):
+            return True
+        if len(chosen) + lower_bound(masks, index, uncovered, allowed) > limit:
+            return False
+        for j in branch_element(index, uncovered, allowed):
+            chosen.append(j)
+            stop = search(uncovered & ~masks[j], allowed)
+            chosen.pop()
+            if stop:
+                return True
+            # Covers with j are all found, later branches leave it out
+            allowed &= ~(1 << j)
+        return False
+    search(uncovered, allowed)
+    return found
+
+def minimum_covers(masks, width, deadline=None):
+    # Every cover with the fewest sets. The optimum is found on the sets that
+    # are not dominated by another one, and then the covers of that size are
+    # enumerated on all sets, as a dominated set may be in an optimal cover too.
+    # Past the deadline, the smallest cover found so far
+    index = element_sets(masks, width)
+    universe = (1 << width) - 1
+    everything = (1 << len(masks)) - 1
+    if any(len(sets) == 0 for sets in index):
+        return []
+    best = greedy_cover(masks, index, universe, everything)
+    reduced = undominated(masks)
+    while len(best) > 1:
+        better = bounded_covers(masks, index, universe, reduced, len(best)-1, [],
+                                first=True, deadline=deadline)
+        if len(better) == 0:
+            break
+        best = better[0]
+    if expired(deadline):
+        return [ best ]
+    found = bounded_covers(masks, index, universe, everything, len(best), [],
+                           deadline=deadline)
+    return found if len(found) > 0 else [ best ]
+
+def exact_covers(masks, width, costs=None, deadline=None):
+    # Every cover whose sets have no element in common. With costs, a tuple
+    # for every set, only the covers with the lowest sum of costs, compared
+    # as tuples. Past the deadline, the covers found so far
+    index = element_sets(masks, width)
+    conflicts = []
+    for mask in masks:
+        conflict = 0
+        m = mask
+        while m:
+            low = m & -m
+            for j in index[low.bit_length()-1]:
+                conflict |= 1 << j
+            m ^= low
+        conflicts += [ conflict ]
+    found = []
+    chosen = []
+    best = [ None ]
+    def search(uncovered, allowed, cost):
+        if costs is not None and best[0] is not None and cost > best[0]:
+            return
+        if uncovered == 0:
+            if costs is not None and (best[0] is None or cost < best[0]):
+                best[0] = cost
+                found.clear()
+            found.append(list(chosen))
+            return
+        if expired(deadline):
+            return
+        for j in branch_element(index, uncovered, allowed):
+            chosen.append(j)
+            if costs is not None:
+                search(uncovered & ~masks[j], allowed & ~conflicts[j],
+                       tuple(a + b for a, b in zip(cost, costs[j])))
+            else:
+                search(uncovered & ~masks[j], allowed & ~conflicts[j], cost)
+            chosen.pop()
+    search((1 << width) - 1, (1 << len(masks)) - 1,
+           None if costs is None or len(costs) == 0 else tuple(0 for c in costs[0]))
+    return found
+
+def single_bit(mask):
+    return mask != 0 and mask & (mask - 1) == 0
+
+def bits(mask):
+    while mask:
+        low = mask & -mask
+        yield low.bit_length()-1
+        mask ^= low
+
+def fewest(masks, positions, live):
+    # Position whose mask has the fewest live bits
+    return min(positions, key=lambda p: bin(masks[p] & live).count("1"))
+
+def cyclic_core(masks, width):
+    # Reduces the table of the sets over width elements until no step applies:
+    # sets that are the only one left for an element are fixed, elements whose
+    # sets include those of another element are dropped, and sets contained in
+    # another set are dropped. Returns the fixed sets, the elements and sets of
+    # the core and, for every set, the sets it dominated
+    index = element_sets(masks, width)
+    element_masks = [ sum(1 << j for j in sets) for sets in index ]
+    live_elements = (1 << width) - 1
+    live_sets = (1 << len(masks)) - 1
+    fixed = []
+    dominated = {}
+    changed = True
+    while changed:
+        changed = False
+        for e in bits(live_elements):
+            if not live_elements >> e & 1:
+                continue
+            sets = element_masks[e] & live_sets
+            if single_bit(sets):
+                j = sets.bit_length()-1
+                fixed += [ j ]
+                live_elements &= ~masks[j]
+                live_sets &= ~sets
+                changed = True
+        for j in bits(live_sets):
+            if masks[j] & live_elements == 0:
+                live_sets &= ~(1 << j)
+        for e in bits(live_elements):
+            if not live_elements >> e & 1:
+                continue
+            sets = element_masks[e] & live_sets
+            if sets == 0:
+                continue
+            for f in bits(masks[fewest(masks, bits(sets), live_elements)] & live_elements):
+                other = element_masks[f] & live_sets
+                if f != e and sets & ~other == 0 and (sets != other or e < f):
+                    live_elements &= ~(1 << f)
+                    changed = True
+        for j in bits(live_sets):
+            mask = masks[j] & live_elements
+            if mask == 0:
+                live_sets &= ~(1 << j)
+                continue
+            e = fewest(element_masks, bits(mask), live_sets)
+            for k in bits(element_masks[e] & live_sets):
+                other = masks[k] & live_elements
+                if k != j and mask & ~other == 0 and (mask != other or k < j):
+                    live_sets &= ~(1 << j)
+                    dominated.setdefault(k, []).append(j)
+                    changed = True
+                    break
+    return fixed, live_elements, list(bits(live_sets)), dominated
+
+def dominated_covers(masks, width, covers, dominated, deadline=None):
+    # Every cover reached from covers by swapping a set for one it dominated,
+    # the covers of the core only keep the dominating sets
+    universe = (1 << width) - 1
+    found = [ sorted(cover) for cover in covers ]
+    seen = set(tuple(cover) for cover in found)
+    for cover in found:
+        for j in cover:
+            if expired(deadline):
+                return found
+            for k in dominated.get(j, ()):
+                if k in cover:
+                    continue
+                swapped = sorted([ i for i in cover if i != j ] + [ k ])
+                if tuple(swapped) in seen:
+                    continue
+                union = 0
+                for i in swapped:
+                    union |= masks[i]
+                if union == universe:
+                    seen.add(tuple(swapped))
+                    found.append(swapped)
+    return found
@@ -1,43 +1,25 @@
 import argparse
-import clingo
-import re
+import contextlib
+import io
 import sys
 import time
 import copy
 import math
+import multiprocessing
+from array import array
 from itertools import product, combinations, groupby
+from minish_solver import solve, solve_optimal, solve_until, solver_args, available_threads, parse_encoding, ModelSession, EquivSession
+from minish_cover import exact_covers, minimum_covers, greedy_cover, element_sets, cyclic_core, dominated_covers, expired
+from minish_cache import cache_key, cover_key, result_key, read_entry, write_entry
+from minish_metrics import Metrics
+from minish_parser import label_to_octal, parse_file, parse_text, format_throughput
 
-def rule_to_label(rulevalues, atoms):
-    lb = ""
-    for atom in sorted(atoms):
-        if not atom in rulevalues['atoms']:
-            lb += "x"
-        else:
-            if atom in rulevalues['phead'] and atom in rulevalues['nhead']:
-                lb += '1'
-            elif atom in rulevalues['phead']:
-                lb += 'z'
-            elif atom in rulevalues['nhead']:
-                lb += 'o'
-            elif atom in rulevalues['pbody']:
-                lb += '2'
-            elif atom in rulevalues['nbody']:
-                lb += '0'
-    return lb
-
-def label_to_octal(label):
-    translation = {
-        '0' : '1',
-        '1' : '2',
-        '2' : '4',
-        'z' : '3',
-        'o' : '6',
-        'x' : '7',
-    }
-    octalstr = ""
-    for a in label:
-        octalstr += translation[a]
-    return int(octalstr, 8)
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+PAIR_CHUNK = 1 << 16
 
 def octal_to_label(octx):
         translation = {
@@ -53,95 +35,248 @@ def octal_to_label(octx):
             label += translation[a]
         return label
 
-def get_countermodels(label):
-    options = {
-        'z': ['0','1'],
-        'o': ['1', '2'],
-        'x': ['0', '1', '2']
-    }
-    combos = [(c,) if c not in options else options[c] for c in label]
-    return (label_to_octal(''.join(o)) for o in product(*combos))
+def popcount(x):
+    return bin(x).count("1")
 
-def get_adjval(octx):
-    weight = { 1: 1, 2: 0, 4: 1,
-                3: 2, 6: 3, 7: 6 }
-    sum = 0
+def digit_ones(octx):
+    # One bit (the 1 bit) set for every octal digit of octx
+    return (8**((octx.bit_length()+2)//3) - 1)//7
+
+def bit_planes(octx):
+    ones = digit_ones(octx)
+    return (octx & ones, (octx >> 1) & ones, (octx >> 2) & ones)
+
+def digit_nonzero(octx, ones):
+    return (octx | (octx >> 1) | (octx >> 2)) & ones
+
+def get_countermodels(octx):
+    options = { 3: (1, 2), 6: (2, 4), 7: (1, 2, 4) }
+    combos = []
+    shift = 0
     while octx:
-        sum += weight[octx & 7]
+        d = octx & 7
+        combos.insert(0, [o << shift for o in options.get(d, (d,))])
         octx >>= 3
-    return sum
+        shift += 3
+    return (sum(o) for o in product(*combos))
+
+def get_adjval(octx):
+    # Digit weights 1:1 2:0 4:1 3:2 6:3 7:6
+    p1, p2, p4 = bit_planes(octx)
+    return (popcount(p1) + popcount(p4) + popcount(p1 & p2) +
+            2*popcount(p2 & p4) + popcount(p1 & p4))
 
 def get_weight(octx):
-    weight = { 1: 0, 2: 0, 4: 0,
-                3: 1, 6: 1, 7: 2 }
-    sum = 0
-    while octx:
-        sum += weight[octx & 7]
-        octx >>= 3
-    return sum
+    p1, p2, p4 = bit_planes(octx)
+    return popcount(p1 & p2) + popcount(p2 & p4)
 
-def is_total(octx):
-    weight = { 1: 0, 2: 0, 4: 1,
-                3: 1, 6: 1, 7: 1 }
-    sum = 0
-    while octx:
-        sum += weight[octx & 7]
-        octx >>= 3
-    return (sum)
+def cube_covers(cube, octx):
+    # Countermodel octx is covered by the term cube if it fits every digit of it
+    return octx & ~cube == 0
+
+def total_cube(cube):
+    # A '1' (octal 2) digit of a countermodel also fits the '2' (octal 4)
+    # digits of the cube, as totalizing a countermodel does
+    return cube | ((cube >> 1) & (digit_ones(cube) << 1))
 
-def get_totalize(label):
-    options = {
-        '2': ['1','2']
-    }
-    combos = [(c,) if c not in options else options[c] for c in label]
-    return (label_to_octal(''.join(o)) for o in product(*combos))
+def cube_size(cube):
+    # Number of countermodels of the cube
+    p1, p2, p4 = bit_planes(cube)
+    threes = p1 & p2 & p4
+    twos = ((p1 & p2) | (p2 & p4) | (p1 & p4)) & ~threes
+    return 2**popcount(twos) * 3**popcount(threes)
 
 def check_partial_adj(p0, p1):
+    ones = digit_ones(max(p0, p1))
     or_ret = p0 | p1
     and_ret = p0 & p1
     xor_ret = p0 ^ p1
-    ret = 0
-    a = p0
-    b = p1
-    eq_count = 0
-    adj_count = 0
-    comp_count = 0
-    oct_len = max(len(oct(a)), len(oct(b))) - 2
-    while a or b or and_ret:
-        if (a & 7 == b & 7):
-            eq_count += 1
-        elif ((b & 7 == and_ret & 7) and (a & 7 == or_ret & 7)):
-            comp_count += 1
-        elif ((and_ret & 7 == 0) and (xor_ret & 7 != 5)):
-            adj_count += 1
-        elif ((and_ret & 7 == 2) and (or_ret & 7 == 7) and (xor_ret & 7 == 5)):
-            adj_count += 1
-        or_ret >>= 3
-        xor_ret >>= 3
-        and_ret >>= 3
-        a >>= 3
-        b >>= 3
-    return (comp_count >= 1) and (adj_count == 1) and (comp_count + eq_count + adj_count == oct_len)
+    x1, x2, x4 = xor_ret & ones, (xor_ret >> 1) & ones, (xor_ret >> 2) & ones
+    a1, a2, a4 = and_ret & ones, (and_ret >> 1) & ones, (and_ret >> 2) & ones
+    neq = digit_nonzero(xor_ret, ones)
+    comp = neq & ~digit_nonzero(p1 & ~p0, ones)
+    fives = x1 & ~x2 & x4
+    adj = ((ones & ~digit_nonzero(and_ret, ones) & ~fives) |
+           (~a1 & a2 & ~a4 & fives & (or_ret & (or_ret >> 1) & (or_ret >> 2))))
+    adj &= ~comp & neq
+    return comp != 0 and popcount(adj) == 1 and ((ones & ~neq) | comp | adj) == ones
 
 def check_adjacent(octx, octy):
-    count_set = 0
-    count_fives = 0
     res = octx | octy
     ret_xor = octx ^ octy
-    res_or = res
-    res_xor = ret_xor
-    while (res_or and res_xor):
-        count_set += 1 if (res_xor & 7 > 0) else 0
-        count_fives += 1 if (res_or & 7 == 5) else 0
-        res_or >>= 3
-        res_xor >>= 3
+    diff = digit_nonzero(ret_xor, digit_ones(ret_xor))
     dict =  { 'is_valid' : False, 'change_pos': 0, 'oct_val' : None }
-    if count_fives == 0 and count_set == 1 and (octx != res and octy != res):
+    if (diff and not diff & (diff - 1) and (res & (diff*7)) != diff*5 and
+            octx != res and octy != res):
         dict['is_valid'] = True
-        dict['change_pos'] = -1 * len(oct(ret_xor)[2:])
+        dict['change_pos'] = diff.bit_length()//3
         dict['oct_val'] = res
     return dict
 
+def masked_keys(octx):
+    return [(pos, octx & ~(7 << 3*pos)) for pos in range((octx.bit_length()+2)//3)]
+
+def index_term(mask_index, octx):
+    # mask_index maps (digit position, term with that digit cleared) to terms
+    for key in masked_keys(octx):
+        if key in mask_index:
+            mask_index[key].add(octx)
+        else:
+            mask_index[key] = { octx }
+
+def unindex_term(mask_index, octx):
+    for key in masked_keys(octx):
+        mask_index[key].discard(octx)
+        if len(mask_index[key]) == 0:
+            del mask_index[key]
+
+def single_digits(octx):
+    # One bit for every digit of octx that has a single value (0, 1 or 2)
+    p1, p2, p4 = bit_planes(octx)
+    return (p1 | p2 | p4) & ~((p1 & p2) | (p2 & p4) | (p1 & p4))
+
+def partial_adj_index(keys, frontier=None):
+    # Terms that can contain another one (weight > 0), grouped by their single
+    # valued digits. Any term partially adjacent to them has the same values on
+    # those digits, except at most at the adjacent one
+    index = {}
+    for pos, k in enumerate(keys):
+        if get_weight(k) == 0 or (frontier is not None and not k in frontier):
+            continue
+        single = single_digits(k)
+        group = index.setdefault(single, {})
+        masked = k & (single*7)
+        group.setdefault((0, masked), []).append(pos)
+        f = single
+        while f:
+            low = f & -f
+            group.setdefault((low, masked & ~(low*7)), []).append(pos)
+            f ^= low
+    return index
+
+def partial_adj_candidates(index, octx):
+    octx_single = single_digits(octx)
+    for single, group in index.items():
+        # octx has to keep the single values of the group but at one digit
+        extra = single & ~octx_single
+        if extra & (extra - 1):
+            continue
+        masked = octx & (single*7)
+        if extra:
+            for pos in group.get((extra, masked & ~(extra*7)), ()):
+                yield pos
+            continue
+        for pos in group.get((0, masked), ()):
+            yield pos
+        f = single
+        while f:
+            low = f & -f
+            for pos in group.get((low, masked & ~(low*7)), ()):
+                yield pos
+            f ^= low
+
+def partial_adj_pairs(keys, frontier=None):
+    # Pairs of combinations(keys, 2) that may be partially adjacent, in the same
+    # order. The first term of the pair is the one containing the second, and with
+    # a frontier at least one of them must be in it
+    full_index = partial_adj_index(keys)
+    if frontier is None:
+        frontier_index = full_index
+    else:
+        frontier_index = partial_adj_index(keys, frontier)
+    pairs = set()
+    for pos, k in enumerate(keys):
+        if frontier is None or k in frontier:
+            index = full_index
+        else:
+            index = frontier_index
+        for cpos in partial_adj_candidates(index, k):
+            if cpos < pos:
+                pairs.add((cpos, pos))
+    return [ (keys[i], keys[j]) for i, j in sorted(pairs) ]
+
+def find_adjacencies(leftminterms, rightminterms, leftfrontier=None, rightfrontier=None):
+    if leftfrontier is None:
+        pairs = product(leftminterms, rightminterms)
+    else:
+        rightnew = [ p1 for p1, f in zip(rightminterms, rightfrontier) if f ]
+        pairs = ((p0, p1) for p0, f in zip(leftminterms, leftfrontier)
+                 for p1 in (rightminterms if f else rightnew))
+    ret = []
+    for p0, p1 in pairs:
+        adj = check_adjacent(p0, p1)
+        if adj['is_valid']:
+            ret += [(p0, p1, adj)]
+    return ret
+
+def adjval_array(minterms):
+    if max(minterms).bit_length() < 64:
+        return np.array(minterms, dtype=np.uint64)
+    return np.array(minterms, dtype=object)
+
+def find_adjacencies_numpy(leftarr, rightarr, leftfrontier=None, rightfrontier=None,
+                           chunk_size=1<<20):
+    # Same test as check_adjacent over a whole bucket pair: exactly one differing
+    # octal digit, no 5 on that digit and neither term contains the other
+    maxval = max(int(leftarr.max()), int(rightarr.max()))
+    ones = (8**((maxval.bit_length()+2)//3) - 1)//7
+    if leftarr.dtype != object:
+        ones = np.uint64(ones)
+    ret = []
+    rows = max(1, chunk_size//max(1, len(rightarr)))
+    y = rightarr[None, :]
+    for start in range(0, len(leftarr), rows):
+        x = leftarr[start:start+rows, None]
+        res_or = x | y
+        res_xor = x ^ y
+        diff = (res_xor | (res_xor >> 1) | (res_xor >> 2)) & ones
+        single = (diff != 0) & ((diff & (diff - 1)) == 0)
+        fives = (res_or & (diff * 7)) == (diff * 5)
+        valid = single & ~fives.astype(bool) & (res_or != x) & (res_or != y)
+        if leftfrontier is not None:
+            valid &= leftfrontier[start:start+rows, None] | rightfrontier[None, :]
+        for i, j in zip(*np.nonzero(valid)):
+            ret += [(int(x[i, 0]), int(rightarr[j]), {
+                'is_valid' : True,
+                'change_pos' : int(diff[i, j]).bit_length()//3,
+                'oct_val' : int(res_or[i, j]) })]
+    return ret
+
+def pair_tasks(valid_pairs, buckets, frontier_flags, engine, chunk_size=None):
+    # One task per bucket pair, left bucket split in chunks of about chunk_size
+    # pairs. Bucket pairs with no frontier term on either side are skipped
+    tasks = []
+    for (l,r) in valid_pairs:
+        left, right = buckets[l], buckets[r]
+        if chunk_size is None:
+            rows = len(left)
+        else:
+            rows = max(1, chunk_size//max(1, len(right)))
+        if frontier_flags is not None:
+            leftflags, rightflags = frontier_flags[l], frontier_flags[r]
+            rightnew = any(rightflags)
+        for start in range(0, len(left), rows):
+            if frontier_flags is None:
+                tasks += [(engine, left[start:start+rows], right, None, None)]
+            elif rightnew or any(leftflags[start:start+rows]):
+                tasks += [(engine, left[start:start+rows], right,
+                           leftflags[start:start+rows], rightflags)]
+    return tasks
+
+def task_pair_count(task):
+    # Pairs a task compares, as many as check_adjacent calls in the python engine
+    engine, left, right, leftflags, rightflags = task
+    if leftflags is None:
+        return len(left)*len(right)
+    leftnew = int(sum(leftflags))
+    return leftnew*len(right) + (len(left)-leftnew)*int(sum(rightflags))
+
+def run_pair_task(task):
+    engine, left, right, leftflags, rightflags = task
+    if engine == 'numpy':
+        return find_adjacencies_numpy(left, right, leftflags, rightflags)
+    return find_adjacencies(left, right, leftflags, rightflags)
+
 def check_simpler(octx, octy):
     res = octx | octy
     ret_xor = octx ^ octy
@@ -158,33 +293,6 @@ def mincover_facts(label_cover_dict):
         facts += "\n"
     return facts
 
-def solve(asp_program, asp_facts, clingo_args):
-    c = clingo.Control(clingo_args)
-    if asp_program != "":
-        c.load("./asp/"+asp_program+".lp")
-    for facts in asp_facts:
-        c.add("base", [], facts)
-    c.ground([("base", [])])
-    ret = []
-    with c.solve(yield_=True) as handle:
-        for m in handle:
-            ret += [m.symbols(shown=True)]
-    return ret
-
-def solve_optimal(asp_program, asp_facts, clingo_args):
-    c = clingo.Control(clingo_args + ["--opt-mode=optN"])
-    if asp_program != "":
-        c.load("./asp/"+asp_program+".lp")
-    for facts in asp_facts:
-        c.add("base", [], facts)
-    c.ground([("base", [])])
-    ret = []
-    with c.solve(yield_=True) as handle:
-        for m in handle:
-            if (m.optimality_proven):
-                ret += [m.symbols(shown=True)]
-    return ret
-
 def rules_to_string(rule_dict):
     terms = []
     for rk,rv in rule_dict.items():
@@ -233,21 +341,63 @@ def label_to_ruledict(label, atomset=[]):
         'nbody' : nbodyset
     })
 
-def cover_table(cover_dict):
-    coveredby = [p['covered_by'] for p in cover_dict.values()]
-    primes = set()
-    for c in coveredby:
-        primes |= set(c)
-    primelb = [ octal_to_label(p) for p in sorted(primes) ]
+def rule_atoms(rule):
+    return rule['phead'] | rule['nhead'] | rule['pbody'] | rule['nbody']
+
+def rule_index(rule_dict):
+    # Rules by atom, a rule can only be contained in rules with all its atoms
+    index = {}
+    for rk, rv in rule_dict.items():
+        for atom in rule_atoms(rv):
+            index.setdefault(atom, set()).add(rk)
+    return index
+
+def rule_contained(rule, base_rule, simpler=False):
+    if simpler:
+        # A head atom may also come from the opposite body part of base_rule
+        return (rule['phead'] <= base_rule['phead'] | base_rule['nbody'] and
+                rule['nhead'] <= base_rule['nhead'] | base_rule['pbody'] and
+                rule['pbody'] <= base_rule['pbody'] and
+                rule['nbody'] <= base_rule['nbody'])
+    return (rule['phead'] <= base_rule['phead'] and
+            rule['nhead'] <= base_rule['nhead'] and
+            rule['pbody'] <= base_rule['pbody'] and
+            rule['nbody'] <= base_rule['nbody'])
+
+def subsumed_rules(base_rules, base_index, rules, simpler=False):
+    # Pairs (rule, base rule) where rule is contained in the base rule, and
+    # the rules not contained in any base rule (cntrules and notsuper)
+    cntrules, notsuper = [], []
+    if len(base_rules) == 0:
+        return cntrules, notsuper
+    for rk, rv in rules.items():
+        atoms = rule_atoms(rv)
+        if len(atoms) == 0:
+            candidates = base_rules.keys()
+        else:
+            candidates = sorted(set.intersection(*[ base_index.get(a, set()) for a in atoms ]))
+        found = False
+        for bk in candidates:
+            if rule_contained(rv, base_rules[bk], simpler):
+                cntrules += [ (rk, bk) ]
+                found = True
+        if not found:
+            notsuper += [ rk ]
+    return cntrules, notsuper
+
+def cover_table(table):
+    primes = sorted(table.primes[j] for j, col in enumerate(table.cols) if len(col) > 0)
+    primelb = [ octal_to_label(p) for p in primes ]
     width = len(primelb[0])
     tablestr = " "*width + "  "
     for lb in primelb:
         tablestr += lb + "  "
     tablestr += "\n"
-    for k in sorted(cover_dict.keys()):
-        tablestr += octal_to_label(k) + "  "
-        for p in sorted(primes):
-            if p in cover_dict[k]['covered_by']:
+    for i in sorted(table.covered_rows(), key=lambda i: table.minterms[i]):
+        covered_by = set(table.primes[j] for j in table.rows[i])
+        tablestr += octal_to_label(table.minterms[i]) + "  "
+        for p in primes:
+            if p in covered_by:
                 tablestr += " "*(width//2) + "x"
                 if width%2:
                     tablestr += " "*(width//2)
@@ -274,200 +424,70 @@ def rules_to_asp(rule_dict, program_number):
         asp += "\n"
     return asp
 
-def main(arguments):
-    parser = argparse.ArgumentParser(description='Here-And-There Logic Program and Theories minimization in ASP')
-    parser.add_argument('file', nargs='?', type=argparse.FileType('r'),
-                        default=sys.stdin, help="TXT File (default: stdin)")
-    parser.add_argument('-hc', '--hybridcover', action='store_true', default=False,
-                        help="Perform mincover in two steps python-ASP instead of all ASP")
-    parser.add_argument('-a', '--all', action='store_true', default=False,
-                        help="Show all minimal solutions instead of a single one")
-    parser.add_argument('-m', '--minmode', choices=['atoms', 'terms'], default='atoms',
-                        help="Minimization method, less atoms by default")
-    parser.add_argument('-t', '--time', action='store_true', default=False,
-                        help="Show time measures for the different stages")
-    parser.add_argument('-te', '--testeq', action='store_true', default=False,
-                        help="Perform Strong Equivalence tests on minimal results")
-    parser.add_argument('-ts', '--testsub', action='store_true', default=False,
-                        help="Perform Subsumption tests on minimal results")
-    parser.add_argument('-ct', '--covertable', action='store_true', default=False,
-                        help="Prints Prime Implicate Cover table")
-    parser.add_argument('-vt', '--verbosetests', action='store_true', default=False,
-                        help="Makes Test Output more verbose")
-    args = parser.parse_args(arguments)
+def expand_countermodels(terms):
+    initial_minterms = dict()
+    for mk in terms:
+        for c in set(get_countermodels(mk)):
+            initial_minterms.update({ c : True })
+    return initial_minterms
 
-    try:
-        input_content = args.file.read()
-    except Exception as exc:
-        print("error parsing file:", args.file.name)
-        print(exc)
-        return 1
-
-    labels = []
-    atoms = set()
-    have_cms = False
+def generate_primes(terms, args, metrics, pool=None):
     have_aggr = False
-    have_rules = False
-    rule_dict = {}
-    rulecount = 1
-    explicit_atoms = set()
-
-    for line in input_content.split('\n'):
-        m = line.strip()
-        atomset = set()
-        pheadset, nheadset = set(), set()
-        pbodyset, nbodyset = set(), set()
-        addrule = False
-        if re.match('^\/\w+\/$', m):
-            explicit_atoms = set(m[1:-1])
-        if re.match('^[012ozx]+$', m) and not have_rules:
-            addrule = True
-            have_cms = True
-            labels += [ m ]
-            rule = label_to_ruledict(m, atomset=sorted(explicit_atoms))
-        if re.match('^[\w;\s]*(?::-)?[\s\w,]*\.$', m) and not have_cms:
-            addrule = True
-            have_rules = True
-            parts = line.replace('.', '').split(':-')
-            for hatom in parts[0].split(';'):
-                if len(hatom) > 0:
-                    ha = hatom.strip()
-                    nots = ha.count("not")
-                    if nots == 0:
-                        pheadset.add(ha)
-                    else:
-                        ha = ha.replace('not', '').strip()
-                        if nots == 1:
-                            nheadset.add(ha)
-                        elif nots == 2:
-                            nbodyset.add(ha)
-                        elif nots > 2:
-                            if nots % 2:
-                                nheadset.add(ha)
-                            else:
-                                nbodyset.add(ha)
-                    atomset.add(ha)
-                if len(parts) > 1:
-                    for batom in parts[1].split(','):
-                        if len(batom) > 0:
-                            ba = batom.strip()
-                            nots = ba.count("not")
-                            if nots == 0:
-                                pbodyset.add(ba)
-                            else:
-                                ba = ba.replace('not', '').strip()
-                                if nots == 1:
-                                    nbodyset.add(ba)
-                                elif nots == 2:
-                                    nheadset.add(ba)
-                                elif nots > 2:
-                                    if nots % 2:
-                                        nbodyset.add(ba)
-                                    else:
-                                        nheadset.add(ba)
-                            atomset.add(ba)
-                for atom in sorted(atomset):
-                    if ((atom in pheadset and atom in pbodyset) or
-                        (atom in nheadset and atom in nbodyset)):
-                        try:
-                            atomset.remove(atom)
-                            pheadset.remove(atom)
-                            pbodyset.remove(atom)
-                            nheadset.remove(atom)
-                            nbodyset.remove(atom)
-                        except:
-                            pass
-                        if len(atomset) == 0:
-                            addrule = False
-                    if ((atom in pheadset and atom in nbodyset) or
-                        (atom in nheadset and atom in pbodyset)):
-                            addrule = False
-                rule = {
-                    'atoms' : atomset,
-                    'phead' : pheadset,
-                    'nhead' : nheadset,
-                    'pbody' : pbodyset,
-                    'nbody' : nbodyset
-                }
-        if addrule:
-            rule_dict.update({ rulecount : rule })
-            atoms |= atomset
-            rulecount += 1
-
-    if len(explicit_atoms) > 0 and not have_rules:
-        atoms = explicit_atoms
-
-    if have_rules:
-        for rk, rv in rule_dict.items():
-            m = rule_to_label(rv, atoms)
-            labels += [ m ]
-
-    labelcount = len(labels)
-
+    # Terms only keep their own cube, countermodels are expanded for the
+    # cover table once the primes are found
     minterm_dict = {}
-    for m in labels:
-        id = label_to_octal(m)
+    mask_index = {}
+    for id in terms:
         if get_weight(id) > 0:
             have_aggr = True
-            covers = list(get_countermodels(m))
-        else:
-            covers = [id]
-        totalcovers = []
-        for c in covers:
-            if is_total(c):
-                label = octal_to_label(c)
-                totalcovers += list(get_totalize(label))
         minterm_dict.update({ id : { 'marked': False,
-                         'adjval' : get_adjval(id),
-                         'covers' : set(covers),
-                         'totalcovers' : set(covers+totalcovers)
-                         } })
-
-    initial_minterms =  dict()
-    for mk, mv in minterm_dict.items():
-        for c in mv['covers']:
-            id = c
-            covers = [c]
-            totalcovers = []
-            if is_total(c):
-                lb = octal_to_label(c)
-                totalcovers = list(get_totalize(lb))
-            initial_minterms.update({
-                id : { 'totalcovers' : set(covers+totalcovers)}
-            })
+                         'adjval' : get_adjval(id) } })
+        index_term(mask_index, id)
 
-    if args.time:
-        pre_pair_loop = time.time()
     adj_count = 1
     exp_count = 1
     step = 0
+    # Only pairs with at least one term created on the previous step can give
+    # anything new, None means every unmarked term is still to be compared
+    frontier = None
+    own_pool = pool is None and args.jobs > 1
+    if own_pool:
+        pool = multiprocessing.Pool(args.jobs)
+    deadline = stage_deadline(args, 'pairs')
+    stopped = False
+    somerules = len(minterm_dict) > 0
     while (adj_count+exp_count) > 0:
+        if expired(deadline):
+            stopped = True
+            break
+        step_span = metrics.start_span('pair step')
         exp_count = 0
         adj_count = 0
+        partial_count = 0
+        partial_pairs = []
+        new_terms = set()
         if have_aggr:
             delete_list = []
             minkeys = [ k for k,v in minterm_dict.items() if not v['marked']]
-            for k1,k2 in combinations(minkeys,2):
+            partial_pairs = partial_adj_pairs(minkeys, frontier)
+            for k1,k2 in partial_pairs:
                 partial = check_partial_adj(k1,k2)
                 if partial:
+                    partial_count += 1
                     expanded = set()
                     if get_weight(k1) > 0:
-                        expanded |= minterm_dict[k1]['covers']
+                        expanded |= set(get_countermodels(k1))
                     if get_weight(k2) > 0:
-                        expanded |= minterm_dict[k2]['covers']
+                        expanded |= set(get_countermodels(k2))
                     expanded_list = list(expanded)
                     for ek in expanded_list:
                         new_add = 0
                         if not ek in minterm_dict.keys():
                             new_add += 1
-                            totalcovers = []
-                            if is_total(ek):
-                                label = octal_to_label(ek)
-                                totalcovers = list(get_totalize(label))
                             minterm_dict.update({ ek : { 'marked': False,
-                                             'adjval' : get_adjval(ek),
-                                             'covers' : set([ek]),
-                                             'totalcovers' : set([ek] + totalcovers) } })
+                                             'adjval' : get_adjval(ek) } })
+                            index_term(mask_index, ek)
+                            new_terms.add(ek)
                         if new_add > 0:
                             if get_weight(k1) > 0:
                                 delete_list += [k1]
@@ -476,12 +496,16 @@ def main(arguments):
                         exp_count += new_add
 
             for k in delete_list:
-                minterm_dict.pop(k, None)
+                if k in minterm_dict:
+                    minterm_dict.pop(k)
+                    unindex_term(mask_index, k)
+                    # Deleted terms may come back from pairs already compared
+                    frontier = None
 
         somerules = True
         if len(minterm_dict.keys()) == 0:
-            print("Program has no fundamental rules")
             somerules = False
+            metrics.end_span(step_span)
             break
 
         #TODO: Fix Adj value since now (z, 2) and (o, 0)
@@ -494,6 +518,20 @@ def main(arguments):
                 else:
                     adjval_dict[keyadjval] += [ k ]
 
+        pair_frontier = None if frontier is None else frontier | new_terms
+        if args.engine == 'numpy':
+            buckets = { k : adjval_array(v) for k, v in adjval_dict.items() }
+        else:
+            buckets = adjval_dict
+        if pair_frontier is None:
+            frontier_flags = None
+        elif args.engine == 'numpy':
+            frontier_flags = { k : np.array([ m in pair_frontier for m in v ], dtype=bool)
+                               for k, v in adjval_dict.items() }
+        else:
+            frontier_flags = { k : [ m in pair_frontier for m in v ]
+                               for k, v in adjval_dict.items() }
+
         sorted_adjval = sorted(adjval_dict)
         len_sorted_adjval = len(adjval_dict)-1
 
@@ -503,272 +541,958 @@ def main(arguments):
             if dif > 0 and dif < 3:
                 valid_pairs += [(p0,p1)]
 
-        for (l,r) in valid_pairs:
-            leftminterms = adjval_dict[l]
-            rightminterms = adjval_dict[r]
-
-            for p0, p1 in product(leftminterms, rightminterms):
-                adj = check_adjacent(p0, p1)
-                if adj['is_valid']:
-                    result = adj['oct_val']
-                    keyadjval = get_adjval(result)
-                    ch_pos = adj['change_pos']
-                    if oct(result)[ch_pos] == '7':
-                        lenres = len(oct(result))
-                        octmask = '0o' + '7'*(lenres-2)
-                        breakpos = lenres + ch_pos
-                        octmask = int(octmask[:breakpos] + '0' + octmask[breakpos+1:],8)
-                        for k in minterm_dict.keys():
-                            if (octmask & k == octmask & result) and (k != result):
-                                minterm_dict[k]['marked'] = True
-                    else:
-                        if oct(p0)[adj['change_pos']] == '2':
-                            minterm_dict[p0]['marked'] = True
-                        if oct(p1)[adj['change_pos']] == '2':
-                            minterm_dict[p1]['marked'] = True
-                    adj_count += 1
-                    if not result in minterm_dict.keys():
-                        newcovers = set.union(minterm_dict[p0]['covers'],
-                                        minterm_dict[p1]['covers'])
-                        newtotalcovers = set.union(minterm_dict[p0]['totalcovers'],
-                                        minterm_dict[p1]['totalcovers'])
-                        minterm_dict.update({ result: { 'marked' : False,
-                                'adjval' : get_adjval(result),
-                                'covers' : newcovers,
-                                'totalcovers' : newtotalcovers } })
+        tasks = pair_tasks(valid_pairs, buckets, frontier_flags, args.engine,
+                           None if pool is None else PAIR_CHUNK)
+        pair_count = sum(task_pair_count(t) for t in tasks)
+        marked_before = sum(1 for v in minterm_dict.values() if v['marked'])
+        if pool is None:
+            task_results = map(run_pair_task, tasks)
+        else:
+            task_results = pool.imap(run_pair_task, tasks)
+
+        # Results come back in task order, so marks and new terms are applied
+        # exactly as in a serial run
+        for adjacencies in task_results:
+            if expired(deadline):
+                stopped = True
+                break
+            for p0, p1, adj in adjacencies:
+                result = adj['oct_val']
+                keyadjval = get_adjval(result)
+                ch_shift = 3*adj['change_pos']
+                if (result >> ch_shift) & 7 == 7:
+                    masked = result & ~(7 << ch_shift)
+                    for k in mask_index.get((adj['change_pos'], masked), ()):
+                        if k != result:
+                            minterm_dict[k]['marked'] = True
+                else:
+                    if (p0 >> ch_shift) & 7 == 2:
+                        minterm_dict[p0]['marked'] = True
+                    if (p1 >> ch_shift) & 7 == 2:
+                        minterm_dict[p1]['marked'] = True
+                adj_count += 1
+                if not result in minterm_dict.keys():
+                    # The cube of result is the union of the cubes of p0 and p1
+                    minterm_dict.update({ result: { 'marked' : False,
+                            'adjval' : get_adjval(result) } })
+                    index_term(mask_index, result)
+                    new_terms.add(result)
+        marked = sum(1 for v in minterm_dict.values() if v['marked']) - marked_before
+        metrics.end_span(step_span)
+        metrics.step({ 'step' : step, 'time' : step_span['time'], 'terms' : len(minterm_dict),
+                       'partial_pairs' : len(partial_pairs), 'partial_adjacencies' : partial_count,
+                       'expanded' : exp_count, 'pairs' : pair_count, 'adjacencies' : adj_count,
+                       'created' : len(new_terms), 'marked' : marked })
+        metrics.count('check_partial_adj', len(partial_pairs))
+        metrics.count('partial_adjacencies', partial_count)
+        metrics.count('check_adjacent', pair_count)
+        metrics.count('adjacencies', adj_count)
+        metrics.count('terms_created', len(new_terms))
+        metrics.count('terms_marked', marked)
+        frontier = new_terms
         step += 1
+        if stopped:
+            break
+    if own_pool:
+        if stopped:
+            pool.terminate()
+        else:
+            pool.close()
+        pool.join()
+
+    if not somerules:
+        return None
+    unmarked = { k: dict(v, **{ 'is_essential' : False }) for k, v in minterm_dict.items() if not v['marked'] }
+    if stopped:
+        # Stopped halfway, the terms so far are implicates but not all prime.
+        # The input terms go back in so that they still cover every countermodel
+        deadline_reached(args, metrics, 'pairs')
+        for k in terms:
+            if not k in unmarked:
+                unmarked[k] = { 'marked' : False, 'adjval' : get_adjval(k), 'is_essential' : False }
+    return unmarked
+
+class CoverTable:
+    # Sparse incidence of the primes and the minterms they cover. cols[j] has
+    # the positions of the minterms covered by primes[j], total_cols[j] the ones
+    # it covers when totalized and rows[i] the primes covering minterms[i].
+    # Every prime walks its own countermodels when they are fewer than the
+    # minterms, otherwise it checks each minterm against its cube. Totalizing
+    # only holds for primes, without total the columns are the plain cubes
+    def __init__(self, primes, minterms, total=True):
+        self.primes = list(primes)
+        self.minterms = list(minterms)
+        self.prime_pos = { p : j for j, p in enumerate(self.primes) }
+        self.minterm_pos = { m : i for i, m in enumerate(self.minterms) }
+        self.cols = [ self.cube_column(p) for p in self.primes ]
+        if total:
+            self.total_cols = [ self.cube_column(total_cube(p)) for p in self.primes ]
+        else:
+            self.total_cols = self.cols
+        self.rows = [ array('i') for m in self.minterms ]
+        for j, col in enumerate(self.cols):
+            for i in col:
+                self.rows[i].append(j)
+
+    def cube_column(self, cube):
+        if cube_size(cube) <= len(self.minterms):
+            col = array('i', sorted(self.minterm_pos[c] for c in get_countermodels(cube)
+                                    if c in self.minterm_pos))
+        else:
+            col = array('i', (i for i, m in enumerate(self.minterms) if cube_covers(cube, m)))
+        return col
+
+    def covered_rows(self):
+        return [ i for i, row in enumerate(self.rows) if len(row) > 0 ]
+
+    def entries(self):
+        return sum(len(col) for col in self.cols)
+
+    def total_cover(self, prime, rows):
+        # Minterms of rows covered by the totalized prime
+        return set(self.minterms[i] for i in self.total_cols[self.prime_pos[prime]] if i in rows)
+
+def stage_args(asp_program, args):
+    return solver_args(asp_program, args.threads, args.configuration, args.opt_strategy)
+
+# Share of the --deadline budget spent by the end of every stage, the time a
+# stage leaves unused goes to the next one
+DEADLINE_SHARES = { 'pairs' : 0.5, 'petrick' : 0.9, 'selection' : 1.0 }
+
+def stage_deadline(args, stage):
+    # time.time() value at which the stage stops, None without a deadline
+    if args.deadline is None:
+        return None
+    return args.started + DEADLINE_SHARES[stage]*args.deadline
+
+def deadline_reached(args, metrics, stage):
+    metrics.count('deadline_' + stage)
+    if args.time:
+        print("Deadline Reached: {0}".format(stage))
+
+def deadline_count(metrics):
+    return sum(n for name, n in metrics.counters.items() if name.startswith('deadline_'))
+
+def stage_solve(asp_program, asp_facts, clingo_args, args, metrics, stage, optimal=True, limit=None):
+    # solve or solve_optimal, cancelled at the deadline of the stage with the
+    # models found so far
+    deadline = stage_deadline(args, stage)
+    if deadline is None and optimal:
+        return solve_optimal(asp_program, asp_facts, clingo_args, metrics, limit)
+    elif deadline is None:
+        return solve(asp_program, asp_facts, clingo_args, metrics)
+    models, finished = solve_until(asp_program, asp_facts, clingo_args, deadline, metrics,
+                                   optimal, limit)
+    if not finished:
+        deadline_reached(args, metrics, stage)
+    return models
+
+def fused_priorities(minmode):
+    # Priorities of the literal and term counts, the minmode one goes first
+    if minmode == 'terms':
+        return { 'terms' : 2, 'literals' : 1 }
+    return { 'literals' : 2, 'terms' : 1 }
+
+def clingo_petrick(id_cover, args, metrics):
+    petrick_facts = mincover_facts(id_cover)
+    if args.hybridcover and not args.nofuse:
+        # Without -a a second optimal cover only tells that there is more than one
+        for name, priority in fused_priorities(args.minmode).items():
+            petrick_facts += "priority({0}, {1}). ".format(name, priority)
+        for k in id_cover.keys():
+            petrick_facts += "literals(\"{0}\", {1}). ".format(k, literal_count(k))
+        petrick_solutions = stage_solve('petrick_hybrid_min', [petrick_facts],
+                                        stage_args('petrick_hybrid_min', args), args, metrics,
+                                        'petrick', limit=None if args.all else 2)
+    elif args.hybridcover:
+        petrick_solutions = stage_solve('petrick_hybrid', [petrick_facts],
+                                        ["0"] + stage_args('petrick_hybrid', args), args, metrics,
+                                        'petrick', optimal=False)
+    else:
+        petrick_solutions = stage_solve('min-cover-full', [petrick_facts],
+                                        stage_args('min-cover-full', args), args, metrics,
+                                        'petrick')
+    petrick_ids = []
+    for sol in petrick_solutions:
+        selected_ids = []
+        for sym in sol:
+            if sym.name == "selectid":
+                id = str(sym.arguments[0])[1:-1]
+                selected_ids += [int(id)]
+        petrick_ids += [selected_ids]
+    return petrick_ids
+
+def cover_masks(id_cover):
+    # Primes of the table and the minterms each one covers as a bitset
+    primes = list(id_cover.keys())
+    bits = { m : b for b, m in enumerate(sorted(set().union(*id_cover.values()))) }
+    masks = [ sum(1 << bits[m] for m in id_cover[p]) for p in primes ]
+    return primes, masks, bits
+
+def python_petrick(id_cover, args, deadline=None):
+    # Same covers as the petrick_hybrid, petrick_hybrid_min and min-cover-full
+    # encodings: every cover by disjoint primes, the best of them for the
+    # minmode, or every cover with the fewest primes
+    if len(id_cover) == 0:
+        return []
+    primes, masks, bits = cover_masks(id_cover)
+    if args.hybridcover and not args.nofuse:
+        priorities = fused_priorities(args.minmode)
+        order = sorted(priorities, key=priorities.get, reverse=True)
+        counts = [ { 'literals' : literal_count(p), 'terms' : 1 } for p in primes ]
+        covers = exact_covers(masks, len(bits), [ tuple(c[name] for name in order) for c in counts ],
+                              deadline)
+    elif args.hybridcover:
+        covers = exact_covers(masks, len(bits), deadline=deadline)
+    else:
+        covers = minimum_covers(masks, len(bits), deadline)
+    return [ [ primes[j] for j in sorted(cover) ] for cover in covers ]
 
-    if somerules:
+def greedy_petrick(id_cover):
+    # One cover of the table, not always minimal nor disjoint
+    primes, masks, bits = cover_masks(id_cover)
+    cover = greedy_cover(masks, element_sets(masks, len(bits)), (1 << len(bits)) - 1,
+                         (1 << len(masks)) - 1)
+    return [ [ primes[j] for j in sorted(cover) ] ]
+
+def solve_petrick(id_cover, args, metrics):
+    entries = sum(len(v) for v in id_cover.values())
+    deadline = stage_deadline(args, 'petrick')
+    if args.petrick == 'python' and entries <= args.petrick_limit:
+        metrics.count('python_covers', 1)
+        petrick_ids = python_petrick(id_cover, args, deadline)
+        if expired(deadline):
+            deadline_reached(args, metrics, 'petrick')
+    else:
+        petrick_ids = clingo_petrick(id_cover, args, metrics)
+    if len(petrick_ids) == 0 and len(id_cover) > 0 and expired(deadline):
+        # No cover by the deadline, the greedy one keeps the program equivalent
+        petrick_ids = greedy_petrick(id_cover)
+    return petrick_ids
+
+def core_petrick(id_cover, args, metrics):
+    # Only the cyclic core of the table goes to the solver. Its covers get the
+    # fixed primes back, and then the primes dominated on the way take the
+    # place of their dominating primes wherever the cover still holds
+    if len(id_cover) == 0:
+        return []
+    primes, masks, bits = cover_masks(id_cover)
+    with metrics.span('core') as core_span:
+        fixed, live, core, dominated = cyclic_core(masks, len(bits))
+    core_cover = { primes[j] : set(m for m in id_cover[primes[j]] if live >> bits[m] & 1) for j in core }
+    core_entries = sum(len(v) for v in core_cover.values())
+    metrics.count('core_rows', popcount(live))
+    metrics.count('core_primes', len(core))
+    metrics.count('core_entries', core_entries)
+    metrics.count('fixed_primes', len(fixed))
+    metrics.count('dominated_primes', sum(len(v) for v in dominated.values()))
+    if args.time:
+        print("Cyclic Core: {0} -> {1} minterms, {2} -> {3} primes ({4} fixed), {5} -> {6} entries, {7:.5f} s".format(
+                len(bits), popcount(live), len(primes), len(core), len(fixed),
+                sum(len(v) for v in id_cover.values()), core_entries, core_span['time']))
+    if live == 0:
+        core_ids = [ [] ]
+    else:
+        core_ids = solve_petrick(core_cover, args, metrics)
+    pos = { p : j for j, p in enumerate(primes) }
+    covers = [ fixed + [ pos[p] for p in ids ] for ids in core_ids ]
+    covers = dominated_covers(masks, len(bits), covers, dominated, stage_deadline(args, 'petrick'))
+    return [ [ primes[j] for j in cover ] for cover in covers ]
+
+def petrick_cover(unmarked, terms, args, stats, metrics, prime=True):
+    # The countermodels of the terms are only expanded here, as the rows of
+    # the cover table. With prime False the candidates are implicates left by
+    # a pair loop that reached the deadline
+    with metrics.span('expansion'):
+        initial_minterms = expand_countermodels(terms)
+    stats['terms'] = len(initial_minterms)
+    cover_span = metrics.start_span('cover')
+    table = CoverTable(unmarked.keys(), initial_minterms.keys(), prime)
+    covered = table.covered_rows()
+    metrics.end_span(cover_span)
+    metrics.count('cover_rows', len(covered))
+    metrics.count('cover_entries', table.entries())
+
+    if args.covertable:
+        print("COVER TABLE")
+        print(cover_table(table))
+
+    if args.hybridcover:
+        essential_span = metrics.start_span('essential')
+        essential_implicates = dict()
+        step = 0
+        fullcover = False
+        used = bytearray(len(table.minterms))
+        while True:
+            essential_count = 0
+            unused_rows = [ i for i in covered if not used[i] ]
+            if len(unused_rows) == 0:
+                fullcover = True
+                break
+            for i in unused_rows:
+                if len(table.rows[i]) == 1:
+                    essential_count += 1
+                    j = table.rows[i][0]
+                    ek = table.primes[j]
+                    essential_implicates.update({ ek : unmarked[ek] })
+                    unmarked[ek]['is_essential'] = True
+                    for m in table.total_cols[j]:
+                        used[m] = True
+            if essential_count == 0:
+                break
+            step += 1
+
+        essential_ids = [k for k in essential_implicates.keys()]
+        metrics.end_span(essential_span)
+        metrics.count('essential_primes', len(essential_ids))
+        stats['stages']['essential'] = cover_span['time'] + essential_span['time']
         if args.time:
-            post_pair_loop = time.time()
-            print("Pair Time: {0:.5f} s".format(post_pair_loop-pre_pair_loop))
-            pre_essential = time.time()
-
-        unmarked = { k: dict(v, **{ 'is_essential' : False }) for k, v in minterm_dict.items() if not v['marked'] }
-
-        cover_dict = dict()
-        for ik, iv in initial_minterms.items():
-            for uk, uv in unmarked.items():
-                if ik in uv['covers']:
-                    if not ik in cover_dict.keys():
-                        cover_dict.update( { ik: { 'covered_by' : [ uk ],
-                                    'is_used' : False } } )
-                    else:
-                        cover_dict[ik]['covered_by'] += [ uk ]
+            print("Essential Extraction Time: {0:.5f} s".format(stats['stages']['essential']))
+
+    petrick_span = metrics.start_span('petrick')
+    if args.hybridcover and fullcover:
+        final_ids = [essential_ids]
+    else:
+        if args.hybridcover:
+            prime_left = { k : v for k, v in unmarked.items() if not v['is_essential']}
+        else:
+            prime_left = unmarked
+            unused_rows = covered
+        minids = set(unused_rows)
 
-        if args.covertable:
-            print("COVER TABLE")
-            print(cover_table(cover_dict))
+        id_cover = {}
+        for k,v in prime_left.items():
+            limited_cover = table.total_cover(k, minids)
+            if len(limited_cover) > 0:
+                id_cover.update( { k : limited_cover } )
 
+        entries = sum(len(v) for v in id_cover.values())
+        metrics.count('petrick_entries', entries)
         if args.hybridcover:
-            essential_implicates = dict()
-            step = 0
-            fullcover = False
-            initial_minterms_set = frozenset(initial_minterms.keys())
-            while True:
-                essential_count = 0
-                unused_cover_dict = { k : v for k, v in cover_dict.items() if not v['is_used']}
-                if len(unused_cover_dict.items()) == 0:
-                    fullcover = True
-                    break
-                for ck, cv in unused_cover_dict.items():
-                    if len(cv['covered_by']) == 1:
-                        essential_count += 1
-                        for ek in cv['covered_by']:
-                            essential_cover = unmarked[ek]['totalcovers']
-                            essential_implicates.update({ ek : { 'totalcovers': essential_cover } })
-                            unmarked[ek]['is_essential'] = True
-                            for minid in list(essential_cover & initial_minterms_set):
-                                cover_dict[minid]['is_used'] = True
-                if essential_count == 0:
-                    break
-                step += 1
-
-            essential_ids = [k for k in essential_implicates.keys()]
+            petrick_ids = solve_petrick(id_cover, args, metrics)
+        else:
+            essential_ids = []
+            if args.nocore:
+                petrick_ids = solve_petrick(id_cover, args, metrics)
+            else:
+                petrick_ids = core_petrick(id_cover, args, metrics)
+        final_ids = [ essential_ids + selected_ids for selected_ids in petrick_ids ]
+
+    metrics.end_span(petrick_span)
+    stats['stages']['petrick'] = petrick_span['time']
+    if args.time:
+        print("Petrick Time: {0:.5f} s".format(petrick_span['time']))
+    return final_ids
+
+def literal_count(octx):
+    # Digits of the term other than 'x' (octal 7)
+    p1, p2, p4 = bit_planes(octx)
+    return (octx.bit_length()+2)//3 - popcount(p1 & p2 & p4)
+
+def solution_cost(ids, minmode):
+    # Same counts as the less-atoms and less-terms encodings
+    ids = set(ids)
+    if minmode == 'terms':
+        return len(ids)
+    return sum(literal_count(id) for id in ids)
+
+def python_selection(final_ids, minmode):
+    # Every solution with the lowest cost, in the order of final_ids
+    costs = [ solution_cost(ids, minmode) for ids in final_ids ]
+    best = min(costs)
+    return [ ids for ids, cost in zip(final_ids, costs) if cost == best ]
+
+def clingo_selection(final_ids, args, metrics):
+    minimize_facts = ""
+    for idx,ids in enumerate(final_ids):
+        asp = "solution({0}). ".format(idx)
+        for id in ids:
+            for x,a in enumerate(octal_to_label(id)):
+                asp += "sol(impl(\"{0}\",x{1},{2}), {3}). ".format(id, x, a, idx)
+        minimize_facts += asp
+
+    minimal_solutions = stage_solve('less-' +args.minmode, [minimize_facts],
+                                    stage_args('less-' + args.minmode, args), args, metrics,
+                                    'selection')
+    selected_solutions = []
+    for sol in minimal_solutions:
+        for sym in sol:
+            if sym.name == "selectsol":
+                selected_solutions += [final_ids[sym.arguments[0].number]]
+    if len(selected_solutions) == 0:
+        # No model by the deadline
+        return python_selection(final_ids, args.minmode)
+    return selected_solutions
+
+def minimize_terms(terms, width, args, metrics, pool=None):
+    pre_pair_loop = time.time()
+    reached = deadline_count(metrics)
+    with metrics.span('reduce'):
+        unique = list(dict.fromkeys(terms))
+    reduction = { 'input' : len(terms), 'duplicates' : len(terms)-len(unique) }
+    terms = unique
+    metrics.count('duplicate_terms', reduction['duplicates'])
+    if args.time:
+        print("Reduction: {0} -> {1} terms ({2} duplicates), {3:.5f} s".format(
+                reduction['input'], len(terms), reduction['duplicates'], time.time()-pre_pair_loop))
+    post_reduce = time.time()
+    entry = {}
+    covkey = cover_key(args.hybridcover, None if args.nofuse else args.minmode, args.all)
+    if args.cache is not None:
+        key = cache_key(terms, width)
+        entry = read_entry(args.cache, key)
+        reskey = result_key(covkey, args.minmode, args.all)
+        if reskey in entry.get('results', {}):
+            result = entry['results'][reskey]
+            stats = { 'terms' : entry['terms'], 'primes' : len(entry['primes']), 'stages' : {},
+                      'reduction' : reduction, 'time' : time.time()-pre_pair_loop, 'cached' : True,
+                      'optimal' : True }
             if args.time:
-                post_essential = time.time()
-                print("Essential Extraction Time: {0:.5f} s".format(post_essential-pre_essential))
+                print("Cache Hit: {0}".format(key))
+            return result['selected'], result['minsolcount'], entry['primes'], stats
 
-        if args.time:
-            pre_petrick = time.time()
-        if args.hybridcover and fullcover:
-            final_ids = [essential_ids]
+    if 'primes' in entry:
+        unmarked = { k: { 'marked' : False, 'adjval' : get_adjval(k), 'is_essential' : False }
+                     for k in entry['primes'] }
+    else:
+        with metrics.span('pairs'):
+            unmarked = generate_primes(terms, args, metrics, pool)
+        if unmarked is None:
+            return None
+    # The countermodel count comes from the cover stage, or from the cache
+    # along with a cached cover
+    stats = { 'terms' : entry.get('terms', 0), 'primes' : len(unmarked), 'stages' : {},
+              'reduction' : reduction }
+
+    post_pair_loop = time.time()
+    stats['stages']['reduce'] = post_reduce-pre_pair_loop
+    stats['stages']['pairs'] = post_pair_loop-post_reduce
+    if args.time:
+        print("Pair Time: {0:.5f} s".format(post_pair_loop-post_reduce))
+
+    if covkey in entry.get('covers', {}):
+        final_ids = entry['covers'][covkey]
+    else:
+        final_ids = petrick_cover(unmarked, terms, args, stats, metrics,
+                                  deadline_count(metrics) == reached)
+    selection_span = metrics.start_span('selection')
+
+    if len(final_ids) > 1:
+        if args.selection == 'python':
+            minimal_solutions = python_selection(final_ids, args.minmode)
         else:
-            if args.hybridcover:
-                prime_left = { k : v for k, v in unmarked.items() if not v['is_essential']}
-            else:
-                prime_left = unmarked
-                unused_cover_dict = cover_dict
-            minids = set()
-            for k in unused_cover_dict.keys():
-                minids.add(k)
-
-            id_cover = {}
-            for k,v in prime_left.items():
-                limited_cover = set(v['totalcovers']) & minids
-                if len(limited_cover) > 0:
-                    id_cover.update( { k : limited_cover } )
-
-            petrick_facts = mincover_facts(id_cover)
-            if args.hybridcover:
-                petrick_solutions = solve('petrick_hybrid', [petrick_facts], ["0"])
-            else:
-                petrick_solutions = solve_optimal('min-cover-full', [petrick_facts], [])
-                essential_ids = []
-            final_ids = []
-            for sol in petrick_solutions:
-                selected_ids = []
-                for sym in sol:
-                    if sym.name == "selectid":
-                        id = str(sym.arguments[0])[1:-1]
-                        selected_ids += [int(id)]
-                final_ids += [essential_ids + selected_ids]
+            minimal_solutions = clingo_selection(final_ids, args, metrics)
+        if not args.all:
+            minsolcount = "1+" if len(minimal_solutions) > 1 else "1"
+            minimal_solutions = [minimal_solutions[0]]
+        else:
+            minsolcount = str(len(minimal_solutions))
+        selected_solutions = minimal_solutions
+    else:
+        minsolcount = "1"
+        selected_solutions = [ final_ids[0] ]
+
+    metrics.end_span(selection_span)
+    post_min = time.time()
+    stats['stages']['selection'] = selection_span['time']
+    stats['time'] = post_min-pre_pair_loop
+    stats['optimal'] = deadline_count(metrics) == reached
+    if args.time:
+        print("Minimal Solution: {0:.5f} s".format(selection_span['time']))
+        print("Total Exec Time: {0:.5f} s".format(post_min-pre_pair_loop))
+        print("")
+    # Best-effort results are not cached, a later run may have more time
+    if args.cache is not None and stats['optimal']:
+        entry['terms'] = stats['terms']
+        entry['primes'] = list(unmarked.keys())
+        entry.setdefault('covers', {})[covkey] = final_ids
+        entry.setdefault('results', {})[reskey] = { 'selected' : selected_solutions,
+                                                    'minsolcount' : minsolcount }
+        write_entry(args.cache, key, entry, args.cache_size*1024*1024)
+    return selected_solutions, minsolcount, list(unmarked.keys()), stats
+
+def term_digit(octx, i, width):
+    # Digit of label position i, 7 ('x') when the atom does not appear
+    return (octx >> 3*(width-1-i)) & 7
+
+def reduce_term(octx, positions, width):
+    red = 0
+    for i in positions:
+        red = (red << 3) | term_digit(octx, i, width)
+    return red
+
+def split_terms(terms, width):
+    # Label positions linked by appearing together (not as 'x') in some term.
+    # Returns the positions of every group and its terms reduced to them
+    parent = list(range(width))
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+    for t in terms:
+        positions = [ i for i in range(width) if term_digit(t, i, width) != 7 ]
+        if len(positions) == 0:
+            return [ (list(range(width)), terms) ]
+        for i in positions[1:]:
+            parent[find(i)] = find(positions[0])
+    groups = {}
+    for i in range(width):
+        groups.setdefault(find(i), []).append(i)
+    components = []
+    for positions in groups.values():
+        compterms = [ reduce_term(t, positions, width) for t in terms
+                      if any(term_digit(t, i, width) != 7 for i in positions) ]
+        if len(compterms) > 0:
+            components += [ (positions, compterms) ]
+    return components
+
+def expand_component_id(octx, positions, width):
+    # Term of a component back on the full signature, 'x' (7) on other positions
+    full = 7*((8**width - 1)//7)
+    for j, i in enumerate(positions):
+        shift = 3*(width-1-i)
+        digit = (octx >> 3*(len(positions)-1-j)) & 7
+        full = (full & ~(7 << shift)) | (digit << shift)
+    return full
+
+def minimize_component(task):
+    terms, width, args = task
+    out = io.StringIO()
+    metrics = Metrics(memory=args.tracemem)
+    with contextlib.redirect_stdout(out):
+        result = minimize_terms(terms, width, args, metrics)
+    return out.getvalue(), result, metrics.to_dict()
+
+def minimize_split(terms, width, args, metrics, pool=None):
+    if len(terms) == 0 or len(split_terms(terms, width)) == 1:
+        return minimize_terms(terms, width, args, metrics, pool)
 
+    pre_split = time.time()
+    components = split_terms(terms, width)
+    # With a pool the subprograms run in parallel instead of their pair loops
+    # and share the clingo threads
+    threads = args.threads
+    if args.jobs > 1:
+        threads = max(1, (threads or available_threads())//args.jobs)
+    compargs = argparse.Namespace(**dict(vars(args), file=None, jobs=1, threads=threads))
+    tasks = [ (compterms, len(positions), compargs) for positions, compterms in components ]
+    if pool is not None:
+        results = pool.map(minimize_component, tasks)
+    elif args.jobs > 1:
+        with multiprocessing.Pool(min(args.jobs, len(tasks))) as pool:
+            results = pool.map(minimize_component, tasks)
+    else:
+        results = map(minimize_component, tasks)
+
+    component_solutions = []
+    component_primes = []
+    minsolcounts = []
+    stats = { 'terms' : 0, 'primes' : 0, 'stages' : {}, 'optimal' : True,
+              'reduction' : { 'input' : 0, 'duplicates' : 0 } }
+    for idx, ((positions, compterms), (out, result, compmetrics)) in enumerate(zip(components, results)):
         if args.time:
-            post_petrick = time.time()
-            print("Petrick Time: {0:.5f} s".format(post_petrick-pre_petrick))
-            pre_min = time.time()
-
-        if len(final_ids) > 1:
-            minimize_facts = ""
-            for idx,ids in enumerate(final_ids):
-                asp = "solution({0}). ".format(idx)
-                for id in ids:
-                    for x,a in enumerate(octal_to_label(id)):
-                        asp += "sol(impl(\"{0}\",x{1},{2}), {3}). ".format(id, x, a, idx)
-                minimize_facts += asp
-
-            #print("Minimizing Solutions by minimal number of {0}".format(args.minmode))
-            minimal_solutions = solve_optimal('less-' +args.minmode, [minimize_facts], [])
-
-            selected_solutions = []
-            if not args.all:
-                if len(minimal_solutions) > 1:
-                    minsolcount = "1+"
-                minimal_solutions = [minimal_solutions[0]]
-            else:
-                minsolcount = str(len(minimal_solutions))
-            for sol in minimal_solutions:
-                for sym in sol:
-                    if sym.name == "selectsol":
-                        selected_solution_id = sym.arguments[0].number
-                        selected_solutions += [final_ids[selected_solution_id]]
+            print("Component {0}: {1} atoms, {2} terms".format(idx, len(positions), len(compterms)))
+        print(out, end="")
+        metrics.merge(compmetrics, "component {0}/".format(idx))
+        if result is None:
+            return None
+        solutions, minsolcount, primes, compstats = result
+        stats['terms'] += compstats['terms']
+        stats['primes'] += compstats['primes']
+        stats['optimal'] = stats['optimal'] and compstats['optimal']
+        for stage, stagetime in compstats['stages'].items():
+            stats['stages'][stage] = stats['stages'].get(stage, 0) + stagetime
+        for name, n in compstats['reduction'].items():
+            stats['reduction'][name] += n
+        full = 7*((8**len(positions) - 1)//7)
+        if any(full in sol for sol in solutions):
+            # A component with no models makes the whole program inconsistent
+            stats['time'] = time.time()-pre_split
+            return [ [ 7*((8**width - 1)//7) ] ], "1", [ 7*((8**width - 1)//7) ], stats
+        component_solutions += [ [ [ expand_component_id(id, positions, width) for id in sol ]
+                                   for sol in solutions ] ]
+        component_primes += [ expand_component_id(id, positions, width) for id in primes ]
+        minsolcounts += [ minsolcount ]
+
+    selected_solutions = [ sum(sols, []) for sols in product(*component_solutions) ]
+    if args.all:
+        minsolcount = str(len(selected_solutions))
+    else:
+        minsolcount = "1+" if "1+" in minsolcounts else "1"
+    stats['time'] = time.time()-pre_split
+    return selected_solutions, minsolcount, component_primes, stats
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Here-And-There Logic Program and Theories minimization in ASP')
+    parser.add_argument('file', nargs='?', type=argparse.FileType('r'),
+                        default=sys.stdin, help="TXT File (default: stdin)")
+    parser.add_argument('-hc', '--hybridcover', action='store_true', default=False,
+                        help="Perform mincover in two steps python-ASP instead of all ASP")
+    parser.add_argument('-a', '--all', action='store_true', default=False,
+                        help="Show all minimal solutions instead of a single one")
+    parser.add_argument('-m', '--minmode', choices=['atoms', 'terms'], default='atoms',
+                        help="Minimization method, less atoms by default")
+    parser.add_argument('-t', '--time', action='store_true', default=False,
+                        help="Show time measures for the different stages")
+    parser.add_argument('-te', '--testeq', action='store_true', default=False,
+                        help="Perform Strong Equivalence tests on minimal results")
+    parser.add_argument('-ts', '--testsub', action='store_true', default=False,
+                        help="Perform Subsumption tests on minimal results")
+    parser.add_argument('-ct', '--covertable', action='store_true', default=False,
+                        help="Prints Prime Implicate Cover table")
+    parser.add_argument('-eq', '--eqmode', choices=['models', 'query'], default='models',
+                        help="Strong Equivalence test by enumerating the HT models of both programs or by a single counterexample query, models by default")
+    parser.add_argument('-vt', '--verbosetests', action='store_true', default=False,
+                        help="Makes Test Output more verbose")
+    parser.add_argument('-e', '--engine', choices=['python', 'numpy'], default='python',
+                        help="Engine for the prime implicate pair loop, python by default")
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help="Worker processes for the prime implicate pair loop, 1 by default")
+    parser.add_argument('-pe', '--petrick', choices=['clingo', 'python'], default='clingo',
+                        help="Solver for the Petrick cover stage, clingo by default")
+    parser.add_argument('-pl', '--petrick-limit', type=int, default=800,
+                        help="Cover table entries above which the python Petrick solver falls back to clingo, 800 by default")
+    parser.add_argument('-sl', '--selection', choices=['python', 'clingo'], default='python',
+                        help="Select the minimal solutions in python or with the less-* encodings, python by default")
+    parser.add_argument('-th', '--threads', type=int, default=1,
+                        help="Clingo threads for the Petrick and solution selection stages, 0 for every core, 1 by default")
+    parser.add_argument('-cf', '--configuration', default='preset',
+                        choices=['preset', 'auto', 'frumpy', 'jumpy', 'tweety', 'handy', 'crafty', 'trendy', 'many'],
+                        help="Clingo configuration portfolio, the preset of each encoding by default")
+    parser.add_argument('-os', '--opt-strategy', default='preset', choices=['preset', 'bb', 'usc'],
+                        help="Clingo optimization strategy, branch and bound or core-guided, the preset of each encoding by default")
+    parser.add_argument('-nf', '--nofuse', action='store_true', default=False,
+                        help="With -hc enumerate every cover and select the minimal ones afterwards, instead of optimizing the minimization mode while covering")
+    parser.add_argument('-nk', '--nocore', action='store_true', default=False,
+                        help="Send the whole cover table to the Petrick stage instead of its cyclic core")
+    parser.add_argument('-sp', '--split', action='store_true', default=False,
+                        help="Split the program into subprograms with no atoms in common and minimize them independently")
+    parser.add_argument('-dl', '--deadline', type=float, default=None,
+                        help="Time budget in seconds, past it every stage stops with its best result so far, none by default")
+    parser.add_argument('-c', '--cache', type=str, default=None,
+                        help="Directory of the cache of prime implicates, covers and minimal solutions, no cache by default")
+    parser.add_argument('-cs', '--cache-size', type=int, default=100,
+                        help="Size limit in MB of the cache directory, 100 by default")
+    parser.add_argument('-mt', '--metrics', type=str, default=None,
+                        help="Write the stage metrics to this JSON file")
+    parser.add_argument('-tm', '--tracemem', action='store_true', default=False,
+                        help="Trace the peak memory of every stage, much slower")
+    return parser
+
+def options(**kwargs):
+    # Options of the command line as a namespace, defaults for the missing ones
+    args = build_parser().parse_args([])
+    for name, value in kwargs.items():
+        if not hasattr(args, name):
+            raise TypeError("unknown option '{0}'".format(name))
+        setattr(args, name, value)
+    return args
+
+class Result:
+    # Minimal programs of one input, with the test outcomes of every solution
+    def __init__(self, terms, atoms, rule_dict, metrics):
+        self.terms = terms
+        self.atoms = atoms
+        self.rules = rule_dict
+        self.metrics = metrics
+        self.solutions = []
+        self.solution_ids = []
+        self.tests = []
+        self.base_models = None
+        self.minsolcount = None
+        self.primes = []
+        self.stats = {}
+        self.parse = None
+
+    def test_count(self, test, status):
+        return sum(1 for t in self.tests if test in t and t[test]['status'] == status)
+
+    def summary(self):
+        return {
+            "errorsub" : self.test_count('subsumption', 'error'),
+            "erroreq"  : self.test_count('equivalence', 'error'),
+            "warnsub"  : self.test_count('subsumption', 'warning'),
+            "atoms"    : len(self.atoms),
+            "rules"    : len(self.terms),
+            "time"     : self.stats['time'],
+            "stages"   : self.stats['stages'],
+            "terms"    : self.stats['terms'],
+            "primes"   : self.stats['primes'],
+            "solutions": len(self.solutions),
+            "size"     : len(self.solution_ids[0]) if len(self.solution_ids) > 0 else 0,
+            "minsolcount" : self.minsolcount,
+            "reduction": self.stats['reduction'],
+            "cached"   : self.stats.get('cached', False),
+            "optimal"  : self.stats.get('optimal', True),
+            "parse"    : self.parse,
+            "metrics"  : self.metrics.to_dict(),
+        }
+
+class Minimizer:
+    # Minimizes parsed programs with one set of options. The encodings are
+    # parsed once and, with jobs, the worker processes are kept between calls
+    def __init__(self, **kwargs):
+        self.args = options(**kwargs)
+        if self.args.engine == 'numpy' and np is None:
+            raise ValueError("numpy engine requires numpy to be installed")
+        if self.args.jobs < 1:
+            raise ValueError("jobs must be at least 1")
+        if self.args.deadline is not None and self.args.deadline < 0:
+            raise ValueError("deadline must not be negative")
+        self.pool = None
+        if not self.args.hybridcover:
+            encodings = [ 'min-cover-full' ]
+        elif self.args.nofuse:
+            encodings = [ 'petrick_hybrid' ]
         else:
-            minsolcount = "1"
-            selected_solutions = [ final_ids[0] ]
+            encodings = [ 'petrick_hybrid_min' ]
+        if self.args.selection == 'clingo':
+            encodings += [ 'less-' + self.args.minmode ]
+        if self.args.testeq:
+            encodings += [ 'test_equiv' if self.args.eqmode == 'query' else 'test_models' ]
+        for encoding in encodings:
+            parse_encoding(encoding)
 
-        if args.time:
-            post_min = time.time()
-            print("Minimal Solution: {0:.5f} s".format(post_min-pre_min))
-            print("Total Exec Time: {0:.5f} s".format(post_min-pre_pair_loop))
-            print("")
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def minimize_file(self, source, metrics=None):
+        # source is a path, an open file or '-' for stdin, read as it is parsed
+        if metrics is None:
+            metrics = Metrics(memory=self.args.tracemem)
+        with metrics.span('parse'):
+            parsed = parse_file(source)
+        return self.minimize_parsed(parsed, metrics)
+
+    def minimize_text(self, input_content, metrics=None):
+        if metrics is None:
+            metrics = Metrics(memory=self.args.tracemem)
+        with metrics.span('parse'):
+            parsed = parse_text(input_content)
+        return self.minimize_parsed(parsed, metrics)
+
+    def minimize_parsed(self, parsed, metrics=None):
+        if metrics is None:
+            metrics = Metrics(memory=self.args.tracemem)
+        metrics.count('parsed_lines', parsed['lines'])
+        metrics.count('parsed_bytes', parsed['bytes'])
+        if self.args.time:
+            print(format_throughput(parsed))
+        result = self.minimize_terms(parsed['terms'], parsed['width'], parsed['atoms'], parsed['rules'], metrics)
+        if result is not None:
+            result.parse = { k : parsed[k] for k in ('lines', 'bytes', 'dropped', 'time') }
+        return result
+
+    def minimize(self, labels, atoms=(), rule_dict=None, metrics=None):
+        terms = [ label_to_octal(lb) for lb in labels ]
+        return self.minimize_terms(terms, len(labels[0]) if len(labels) > 0 else 0, atoms, rule_dict, metrics)
+
+    def minimize_terms(self, terms, width, atoms=(), rule_dict=None, metrics=None):
+        # None when the program has no fundamental rules
+        args = self.args
+        if metrics is None:
+            metrics = Metrics(memory=args.tracemem)
+        atoms = sorted(atoms)
+        if args.jobs > 1 and self.pool is None:
+            self.pool = multiprocessing.Pool(args.jobs)
+        if args.deadline is not None:
+            # Every stage deadline, also in the split components, counts from here
+            args = argparse.Namespace(**dict(vars(args), started=time.time()))
+
+        if args.split:
+            minimized = minimize_split(terms, width, args, metrics, self.pool)
+        else:
+            minimized = minimize_terms(terms, width, args, metrics, self.pool)
+        if minimized is None:
+            return None
+        if rule_dict is None and (args.testeq or args.testsub):
+            # Labels inputs only need their rules for the tests
+            rule_dict = { idx+1 : label_to_ruledict(octal_to_label(t), atomset=atoms) for idx, t in enumerate(terms) }
+        result = Result(terms, atoms, rule_dict, metrics)
+        result.solution_ids, result.minsolcount, result.primes, result.stats = minimized
 
         atomfacts = ""
-        for a in sorted(atoms):
+        for a in atoms:
             atomfacts += "sigatom('{0}'). ".format(a)
-        base_program = rules_to_asp(rule_dict, 1)
         if args.testeq:
-            models_p1 = solve('test_models', [base_program, atomfacts], ["0"])
-            models_p1 = [sorted(m) for m in models_p1]
-        print("Optimal Minimal Solutions: {0}".format(minsolcount))
-        acum_error_smaller = 0
-        acum_error_noteq = 0
-        acum_warning_smaller = 0
-        initial_labels = labels
-        for idx,sol in enumerate(selected_solutions):
-            print("MINIMAL SOLUTION #{0}".format(idx))
-            labels = []
+            base_program = rules_to_asp(rule_dict, 1)
+        if args.testeq and args.eqmode == 'query':
+            equiv_session = EquivSession(atomfacts, base_program, metrics=metrics)
+        elif args.testeq:
+            model_session = ModelSession(atomfacts, metrics)
+            with metrics.span('test models'):
+                result.base_models = [ sorted(m) for m in model_session.models(base_program, 1) ]
+                models_p1_set = set(tuple(m) for m in result.base_models)
+        if args.testsub:
+            base_index = rule_index(rule_dict)
+
+        for idx, sol in enumerate(result.solution_ids):
             rules = dict()
-            for id in sol:
-                labels += [ octal_to_label(int(id))]
-            for jdx,lb in enumerate(labels):
-                rules.update({jdx+1 : label_to_ruledict(lb, atomset=sorted(atoms))})
+            for jdx, id in enumerate(sol):
+                rules.update({ jdx+1 : label_to_ruledict(octal_to_label(int(id)), atomset=atoms) })
             min_program = rules_to_asp(rules, idx+2)
-            print(rules_to_string(rules))
+            test = {}
             if args.testsub:
-                cnt, notsuper = 0, 0
-                test_sol = solve('test_subprogram', [base_program, min_program], [])
-                for sym in test_sol[0]:
-                    if sym.name == 'cntrules':
-                        cnt += 1
-                        cntargs = sym.arguments
-                        if args.verbosetests:
-                            print("RULE {0} subsums BASE PROGRAM'S RULE {1}".format(cntargs[1].number, cntargs[3].number))
-                    elif sym.name == 'notsuper':
-                        notsuper += 1
-                        notsuperargs = sym.arguments
-                        if args.verbosetests:
-                            print("RULE {0} doesn't subsum any rule of P1".format(notsuperargs[1].number))
-                if notsuper == 0:
-                    print("[SUBSUM TEST] OK")
-                else:
-                    suberror = False
-                    warned = False
-                    notsimpler = 0
-                    # Check that the rulecount is the same and not greater, at least
-                    # the program is sintactically simpler to give it a soft pass
-                    simpler_test_sol = solve('test_simpler', [base_program, min_program], [])
-                    for sym in simpler_test_sol[0]:
-                        if sym.name == 'cntrules':
-                            cnt += 1
-                            cntargs = sym.arguments
-                        elif sym.name == 'notsuper':
-                            notsimpler += 1
-                            notsuperargs = sym.arguments
-                        if notsimpler == 0:
-                            warned = True
-                        else:
-                            suberror = True
-                    if suberror:
-                        print("[SUBSUM TEST] ERROR")
-                        acum_error_smaller += 1
-                    elif warned:
-                        print("[SUBSUM TEST] WARNING: Program is equal in size, but sintactically simpler")
-                        acum_warning_smaller += 1
-            if args.testeq:
-                models_pmin = solve('test_models', [min_program, atomfacts], ["0"])
-                models_pmin = [sorted(m) for m in models_pmin]
-                partcount = 0
-                for m in models_p1:
-                    if args.verbosetests:
-                        if m in models_pmin:
-                            print("MODEL {0} is also in the minimal program models".format(m))
-                        else:
-                            print("MODEL {0} is not in the minimal program models".format(m))
-                        partcount += 1
-                for m in models_pmin:
-                    if args.verbosetests:
-                        if m in models_p1:
-                            print("MODEL {0} is also in the original program models".format(m))
-                        else:
-                            print("MODEL {0} is not in the original program models".format(m))
-                        partcount += 1
-                if partcount == 0:
-                    print("[STRONG EQ TEST] OK")
-                else:
-                    print("[STRONG EQ TEST] ERROR")
-                    acum_error_noteq += 1
-        if args.testsub:
-            if acum_error_smaller == 0:
-                if acum_warning_smaller == 0:
-                    print("[TEST RESULT] All solutions are smaller")
-                else:
-                    print("[TEST RESULT] All solutions are smaller or equal but sintactically simpler")
+                with metrics.span('test subsumption'):
+                    test['subsumption'] = subsumption_test(rule_dict, base_index, rules)
+            if args.testeq and args.eqmode == 'query':
+                with metrics.span('test equivalence'):
+                    counterexample = equiv_session.counterexample(min_program, idx+2)
+                test['equivalence'] = { 'status' : "ok" if counterexample is None else "error" }
+                if counterexample is not None:
+                    model = [ sym.arguments[0].number for sym in counterexample if sym.name == 'model' ]
+                    test['equivalence']['counterexample'] = {
+                        'here'    : sorted(sym.arguments[0].name.strip("'") for sym in counterexample if sym.name == 'here'),
+                        'there'   : sorted(sym.arguments[0].name.strip("'") for sym in counterexample if sym.name == 'there'),
+                        'program' : "original" if model == [1] else "minimal",
+                    }
+            elif args.testeq:
+                with metrics.span('test equivalence'):
+                    models_pmin = [ sorted(m) for m in model_session.models(min_program, idx+2) ]
+                    models_pmin_set = set(tuple(m) for m in models_pmin)
+                    partcount = sum(1 for m in result.base_models if not tuple(m) in models_pmin_set)
+                    partcount += sum(1 for m in models_pmin if not tuple(m) in models_p1_set)
+                test['equivalence'] = { 'status' : "ok" if partcount == 0 else "error",
+                                        'models' : models_pmin, 'mismatches' : partcount }
+            result.solutions += [ rules ]
+            result.tests += [ test ]
+        return result
+
+def subsumption_test(rule_dict, base_index, rules):
+    cntrules, notsuper = subsumed_rules(rule_dict, base_index, rules)
+    test = { 'cntrules' : cntrules, 'notsuper' : notsuper, 'status' : "ok" }
+    if len(notsuper) > 0:
+        # Check that the rulecount is the same and not greater, at least
+        # the program is sintactically simpler to give it a soft pass
+        simpler_cntrules, notsimpler = subsumed_rules(rule_dict, base_index, rules, simpler=True)
+        if len(notsimpler) > 0:
+            test['status'] = "error"
+        elif len(simpler_cntrules) > 0:
+            test['status'] = "warning"
+        else:
+            test['status'] = None
+    return test
+
+def format_stages(stats):
+    # The stage times printed by -t, from the stats of a result
+    out = ""
+    if 'reduce' in stats['stages']:
+        reduction = stats['reduction']
+        out += "Reduction: {0} -> {1} terms ({2} duplicates), {3:.5f} s\n".format(
+                reduction['input'], reduction['input']-reduction['duplicates'],
+                reduction['duplicates'], stats['stages']['reduce'])
+    if stats.get('cached', False):
+        out += "Cache Hit\n"
+    if not stats.get('optimal', True):
+        out += "Deadline Reached\n"
+    if 'pairs' in stats['stages']:
+        out += "Pair Time: {0:.5f} s\n".format(stats['stages']['pairs'])
+    if 'essential' in stats['stages']:
+        out += "Essential Extraction Time: {0:.5f} s\n".format(stats['stages']['essential'])
+    if 'petrick' in stats['stages']:
+        out += "Petrick Time: {0:.5f} s\n".format(stats['stages']['petrick'])
+    if 'selection' in stats['stages']:
+        out += "Minimal Solution: {0:.5f} s\n".format(stats['stages']['selection'])
+        out += "Total Exec Time: {0:.5f} s\n\n".format(stats['time'])
+    return out
+
+def format_result(result, args):
+    if result.stats.get('optimal', True):
+        out = "Optimal Minimal Solutions: {0}\n".format(result.minsolcount)
+    else:
+        out = "Best-Effort Solutions: {0} (deadline reached)\n".format(result.minsolcount)
+    if result.base_models is not None:
+        models_p1_set = set(tuple(m) for m in result.base_models)
+    for idx, (rules, test) in enumerate(zip(result.solutions, result.tests)):
+        out += "MINIMAL SOLUTION #{0}\n".format(idx)
+        out += rules_to_string(rules) + "\n"
+        if 'subsumption' in test:
+            sub = test['subsumption']
+            if args.verbosetests:
+                for rk, bk in sub['cntrules']:
+                    out += "RULE {0} subsums BASE PROGRAM'S RULE {1}\n".format(rk, bk)
+                for rk in sub['notsuper']:
+                    out += "RULE {0} doesn't subsum any rule of P1\n".format(rk)
+            if sub['status'] == "ok":
+                out += "[SUBSUM TEST] OK\n"
+            elif sub['status'] == "error":
+                out += "[SUBSUM TEST] ERROR\n"
+            elif sub['status'] == "warning":
+                out += "[SUBSUM TEST] WARNING: Program is equal in size, but sintactically simpler\n"
+        if 'equivalence' in test:
+            eq = test['equivalence']
+            if 'models' in eq and args.verbosetests:
+                models_pmin_set = set(tuple(m) for m in eq['models'])
+                for m in result.base_models:
+                    if tuple(m) in models_pmin_set:
+                        out += "MODEL {0} is also in the minimal program models\n".format(m)
+                    else:
+                        out += "MODEL {0} is not in the minimal program models\n".format(m)
+                for m in eq['models']:
+                    if tuple(m) in models_p1_set:
+                        out += "MODEL {0} is also in the original program models\n".format(m)
+                    else:
+                        out += "MODEL {0} is not in the original program models\n".format(m)
+            if 'counterexample' in eq:
+                cex = eq['counterexample']
+                out += "COUNTEREXAMPLE H={{{0}}} T={{{1}}} is only a model of the {2} program\n".format(
+                        ", ".join(cex['here']), ", ".join(cex['there']), cex['program'])
+            if eq['status'] == "ok":
+                out += "[STRONG EQ TEST] OK\n"
             else:
-                print("[TEST RESULT] There are {0} solutions that are not smaller".format(acum_error_smaller))
-        if args.testeq:
-            if acum_error_noteq == 0:
-                print("[TEST RESULT] All solutions are strongly equivalent")
+                out += "[STRONG EQ TEST] ERROR\n"
+    if args.testsub:
+        errors = result.test_count('subsumption', 'error')
+        if errors == 0:
+            if result.test_count('subsumption', 'warning') == 0:
+                out += "[TEST RESULT] All solutions are smaller\n"
             else:
-                print("[TEST RESULT] There are {0} solutions that are not strongly equivalent".format(acum_error_noteq))
-        statsdict = {
-            "errorsub" : acum_error_smaller,
-            "erroreq"  : acum_error_noteq,
-            "atoms"    : len(atoms),
-            "rules"    : labelcount,
-            "time"     : post_min-pre_pair_loop,
-        }
-        return statsdict
+                out += "[TEST RESULT] All solutions are smaller or equal but sintactically simpler\n"
+        else:
+            out += "[TEST RESULT] There are {0} solutions that are not smaller\n".format(errors)
+    if args.testeq:
+        errors = result.test_count('equivalence', 'error')
+        if errors == 0:
+            out += "[TEST RESULT] All solutions are strongly equivalent\n"
+        else:
+            out += "[TEST RESULT] There are {0} solutions that are not strongly equivalent\n".format(errors)
+    return out
+
+def main(arguments):
+    parser = build_parser()
+    args = parser.parse_args(arguments)
+
+    # The options are checked by the Minimizer
+    try:
+        minimizer = Minimizer(**vars(args))
+    except ValueError as exc:
+        parser.error(str(exc))
+
+    metrics = Metrics(memory=args.tracemem)
+    with minimizer:
+        try:
+            result = minimizer.minimize_file(args.file, metrics)
+        except (OSError, UnicodeDecodeError) as exc:
+            print("error parsing file:", args.file.name)
+            print(exc)
+            return 1
+    if result is None:
+        print("Program has no fundamental rules")
+        return None
+    print(format_result(result, args), end="")
+    if args.metrics is not None:
+        metrics.export(args.metrics)
+    return result.summary()
 
 if __name__ == "__main__":
     import sys
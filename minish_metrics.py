@@ -0,0 +1,84 @@
+import contextlib
+import json
+import resource
+import time
+import tracemalloc
+
+class Metrics:
+    # Named spans, counters, pair loop steps and clingo statistics of one run.
+    # Spans may nest, with tracing every span gets the peak of the Python
+    # allocations made while it was open
+    def __init__(self, memory=False):
+        self.memory = memory
+        self.origin = time.time()
+        self.spans = []
+        self.counters = {}
+        self.steps = []
+        self.solver = []
+        self.open_spans = []
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def fold_peak(self):
+        peak = tracemalloc.get_traced_memory()[1]
+        for record in self.open_spans:
+            record['peak_memory'] = max(record.get('peak_memory', 0), peak)
+        tracemalloc.reset_peak()
+
+    def start_span(self, name):
+        record = { 'name' : name, 'start' : time.time()-self.origin }
+        if self.memory:
+            self.fold_peak()
+        self.open_spans.append(record)
+        return record
+
+    def end_span(self, record):
+        record['time'] = time.time()-self.origin-record['start']
+        if self.memory:
+            self.fold_peak()
+        self.open_spans = [ r for r in self.open_spans if r is not record ]
+        # Peak resident size of the whole process so far, in bytes
+        record['max_rss'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss*1024
+        self.spans.append(record)
+        return record
+
+    @contextlib.contextmanager
+    def span(self, name):
+        record = self.start_span(name)
+        try:
+            yield record
+        finally:
+            self.end_span(record)
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def step(self, record):
+        self.steps.append(record)
+
+    def solver_statistics(self, name, statistics):
+        self.solver.append(dict(statistics, encoding=name))
+
+    def span_time(self, name):
+        return sum(record['time'] for record in self.spans if record['name'] == name)
+
+    def merge(self, other, prefix):
+        # Metrics of a subprogram, usually from another process
+        for record in other['spans']:
+            self.spans.append(dict(record, name=prefix + record['name']))
+        for name, n in other['counters'].items():
+            self.count(name, n)
+        self.steps += [ dict(record, component=prefix) for record in other['steps'] ]
+        self.solver += [ dict(record, component=prefix) for record in other['solver'] ]
+
+    def to_dict(self):
+        return {
+            'spans'    : self.spans,
+            'counters' : self.counters,
+            'steps'    : self.steps,
+            'solver'   : self.solver,
+        }
+
+    def export(self, path):
+        with open(path, 'w') as fout:
+            json.dump(self.to_dict(), fout, indent=1)
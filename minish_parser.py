@@ -0,0 +1,159 @@
+import re
+import sys
+import time
+
+ATOMS_LINE = re.compile(r'^/\w+/$')
+LABEL_LINE = re.compile(r'^[012ozx]+$')
+RULE_LINE = re.compile(r'^[\w;\s]*(?::-)?[\s\w,]*\.$')
+OCTAL_DIGITS = str.maketrans('012zox', '124367')
+
+def label_to_octal(label):
+    return int(label.translate(OCTAL_DIGITS), 8)
+
+def rule_to_label(rulevalues, atoms):
+    lb = ""
+    for atom in sorted(atoms):
+        if not atom in rulevalues['atoms']:
+            lb += "x"
+        else:
+            if atom in rulevalues['phead'] and atom in rulevalues['nhead']:
+                lb += '1'
+            elif atom in rulevalues['phead']:
+                lb += 'z'
+            elif atom in rulevalues['nhead']:
+                lb += 'o'
+            elif atom in rulevalues['pbody']:
+                lb += '2'
+            elif atom in rulevalues['nbody']:
+                lb += '0'
+    return lb
+
+def literal_parts(literal, positive, negative, double):
+    # An odd number of nots puts the atom in the negative part, an even one
+    # in the opposite part of the rule
+    nots = literal.count("not")
+    if nots == 0:
+        positive.add(literal)
+        return literal
+    literal = literal.replace('not', '').strip()
+    if nots == 1 or (nots > 2 and nots % 2):
+        negative.add(literal)
+    else:
+        double.add(literal)
+    return literal
+
+def parse_rule(line):
+    # Atom sets of a rule line, and whether the rule is kept. The body and the
+    # tautologies are handled again after every head atom
+    atomset = set()
+    pheadset, nheadset = set(), set()
+    pbodyset, nbodyset = set(), set()
+    addrule = True
+    parts = line.replace('.', '').split(':-')
+    for hatom in parts[0].split(';'):
+        if len(hatom) > 0:
+            atomset.add(literal_parts(hatom.strip(), pheadset, nheadset, nbodyset))
+        if len(parts) > 1:
+            for batom in parts[1].split(','):
+                if len(batom) > 0:
+                    atomset.add(literal_parts(batom.strip(), pbodyset, nbodyset, nheadset))
+        for atom in sorted(atomset):
+            if ((atom in pheadset and atom in pbodyset) or
+                (atom in nheadset and atom in nbodyset)):
+                try:
+                    atomset.remove(atom)
+                    pheadset.remove(atom)
+                    pbodyset.remove(atom)
+                    nheadset.remove(atom)
+                    nbodyset.remove(atom)
+                except:
+                    pass
+                if len(atomset) == 0:
+                    addrule = False
+            if ((atom in pheadset and atom in nbodyset) or
+                (atom in nheadset and atom in pbodyset)):
+                    addrule = False
+    rule = {
+        'atoms' : atomset,
+        'phead' : pheadset,
+        'nhead' : nheadset,
+        'pbody' : pbodyset,
+        'nbody' : nbodyset
+    }
+    return rule, addrule
+
+def parse_lines(lines):
+    # Terms of an input given line by line, either minterm labels (kept as
+    # octal terms only) or program rules, which need every atom first
+    pre_parse = time.time()
+    terms = []
+    width = None
+    atoms = set()
+    explicit_atoms = set()
+    have_cms = False
+    have_rules = False
+    rule_dict = {}
+    rulecount = 1
+    linecount = 0
+    bytecount = 0
+    dropped = 0
+    for line in lines:
+        linecount += 1
+        bytecount += len(line.encode())
+        if line.endswith('\n'):
+            line = line[:-1]
+        m = line.strip()
+        if ATOMS_LINE.match(m):
+            explicit_atoms = set(m[1:-1])
+        elif LABEL_LINE.match(m):
+            if not have_rules:
+                have_cms = True
+                terms += [ label_to_octal(m) ]
+                if width is None:
+                    width = len(m)
+        elif RULE_LINE.match(m) and not have_cms:
+            have_rules = True
+            rule, addrule = parse_rule(line)
+            if addrule:
+                rule_dict.update({ rulecount : rule })
+                atoms |= rule['atoms']
+                rulecount += 1
+            else:
+                dropped += 1
+
+    if len(explicit_atoms) > 0 and not have_rules:
+        atoms = explicit_atoms
+
+    if have_rules and len(atoms) > 0:
+        width = len(atoms)
+        for rk, rv in rule_dict.items():
+            terms += [ label_to_octal(rule_to_label(rv, atoms)) ]
+
+    return {
+        'terms'   : terms,
+        'width'   : width if width is not None else 0,
+        'atoms'   : atoms,
+        # Rules of a labels input are only built when they are needed
+        'rules'   : rule_dict if have_rules else None,
+        'lines'   : linecount,
+        'bytes'   : bytecount,
+        'dropped' : dropped,
+        'time'    : time.time()-pre_parse,
+    }
+
+def parse_file(source):
+    # Lines are read as they are parsed, source is a path, a file or '-'
+    if source == '-':
+        return parse_lines(sys.stdin)
+    if isinstance(source, str):
+        with open(source, 'r') as fin:
+            return parse_lines(fin)
+    return parse_lines(source)
+
+def parse_text(input_content):
+    return parse_lines(input_content.split('\n'))
+
+def format_throughput(parsed):
+    t = max(parsed['time'], 1e-9)
+    return "Parse Time: {0} lines, {1:.0f} lines/s, {2:.2f} MB/s, {3:.5f} s".format(
+            parsed['lines'], parsed['lines']/t, parsed['bytes']/t/(1024*1024), parsed['time'])
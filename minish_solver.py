@@ -0,0 +1,260 @@
+import os
+import signal
+import sys
+import time
+import threading
+import multiprocessing
+import clingo
+import clingo.ast
+
+ASP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "asp")
+
+# Parsed encodings, every file is read once per process
+encodings = dict()
+
+def encoding_path(asp_program):
+    return os.path.join(ASP_DIR, asp_program + ".lp")
+
+def parse_encoding(asp_program):
+    if not asp_program in encodings:
+        statements = []
+        clingo.ast.parse_files([encoding_path(asp_program)], statements.append)
+        encodings[asp_program] = statements
+    return encodings[asp_program]
+
+# Solver configuration and optimization strategy that work best for every
+# encoding. Cover tables are crafted problems, while the less-* selections
+# are mostly grounding and only gain a little from core-guided optimization
+PRESETS = {
+    'min-cover-full' : { 'configuration' : 'crafty', 'opt_strategy' : 'bb' },
+    'petrick_hybrid' : { 'configuration' : 'auto', 'opt_strategy' : None },
+    'petrick_hybrid_min' : { 'configuration' : 'crafty', 'opt_strategy' : 'bb' },
+    'less-atoms'     : { 'configuration' : 'auto', 'opt_strategy' : 'usc' },
+    'less-terms'     : { 'configuration' : 'auto', 'opt_strategy' : 'usc' },
+}
+
+def available_threads(workers=1):
+    # Cores left to every one of workers processes solving at the same time
+    return max(1, (os.cpu_count() or 1) // max(1, workers))
+
+def solver_args(asp_program, threads=1, configuration='preset', opt_strategy='preset'):
+    # Clingo arguments of a stage, 'preset' takes the value of PRESETS and
+    # 0 threads takes every core
+    preset = PRESETS.get(asp_program, {})
+    if configuration == 'preset':
+        configuration = preset.get('configuration')
+    if opt_strategy == 'preset':
+        opt_strategy = preset.get('opt_strategy')
+    if threads == 0:
+        threads = available_threads()
+    clingo_args = []
+    if configuration is not None:
+        clingo_args += ["--configuration=" + configuration]
+    if opt_strategy is not None:
+        clingo_args += ["--opt-strategy=" + opt_strategy]
+    if threads > 1:
+        clingo_args += ["--parallel-mode={0},compete".format(threads)]
+    return clingo_args
+
+def add_encoding(c, asp_program):
+    with clingo.ast.ProgramBuilder(c) as builder:
+        for statement in parse_encoding(asp_program):
+            builder.add(statement)
+
+def new_control(asp_program, asp_facts, clingo_args):
+    c = clingo.Control(clingo_args)
+    if asp_program != "":
+        add_encoding(c, asp_program)
+    for facts in asp_facts:
+        c.add("base", [], facts)
+    c.ground([("base", [])])
+    return c
+
+def control_statistics(c):
+    # Grounding size and search effort of the last solve call
+    stats = c.statistics
+    return {
+        'atoms'       : stats['problem']['lp']['atoms'],
+        'rules'       : stats['problem']['lp']['rules'],
+        'variables'   : stats['problem']['generator']['vars'],
+        'constraints' : stats['problem']['generator']['constraints'],
+        'choices'     : stats['solving']['solvers']['choices'],
+        'conflicts'   : stats['solving']['solvers']['conflicts'],
+        'models'      : stats['summary']['models']['enumerated'],
+        'time'        : stats['summary']['times']['total'],
+    }
+
+def solve(asp_program, asp_facts, clingo_args, metrics=None):
+    c = new_control(asp_program, asp_facts, clingo_args)
+    ret = []
+    with c.solve(yield_=True) as handle:
+        for m in handle:
+            ret += [m.symbols(shown=True)]
+    if metrics is not None:
+        metrics.solver_statistics(asp_program, control_statistics(c))
+    return ret
+
+def solve_optimal(asp_program, asp_facts, clingo_args, metrics=None, limit=None):
+    # Every optimal model, or the first limit of them
+    c = new_control(asp_program, asp_facts, clingo_args + ["--opt-mode=optN"])
+    ret = []
+    with c.solve(yield_=True) as handle:
+        for m in handle:
+            if (m.optimality_proven):
+                ret += [m.symbols(shown=True)]
+                if limit is not None and len(ret) >= limit:
+                    break
+    if metrics is not None:
+        metrics.solver_statistics(asp_program, control_statistics(c))
+    return ret
+
+# Seconds a search cancelled at the deadline has to send its statistics
+# before its process is terminated
+UNTIL_GRACE = 0.1
+
+def until_models(asp_program, asp_facts, clingo_args, deadline, optimal, limit, send):
+    # Grounds and solves, sending every model with whether it counts as found
+    # as soon as it is found, until limit of them count. The search is
+    # cancelled through its async handle at the deadline, a time.time() value
+    c = new_control(asp_program, asp_facts, clingo_args)
+    finished = False
+    found = 0
+    with c.solve(yield_=True, async_=True) as handle:
+        while handle.wait(max(0.0, deadline - time.time())):
+            m = handle.model()
+            if m is None:
+                finished = True
+                break
+            counts = not optimal or m.optimality_proven
+            send(('model', [ str(sym) for sym in m.symbols(shown=True) ], counts))
+            found += counts
+            if limit is not None and found >= limit:
+                finished = True
+                break
+            handle.resume()
+        if not finished:
+            handle.cancel()
+    send(('done', finished, control_statistics(c)))
+
+def until_worker(asp_program, asp_facts, clingo_args, deadline, optimal, limit, conn):
+    until_models(asp_program, asp_facts, clingo_args, deadline, optimal, limit, conn.send)
+    conn.close()
+
+def until_exit(signum, frame):
+    # SIGTERM to the caller of a search in its own process, exits through the
+    # finally that stops the search
+    sys.exit(128 + signum)
+
+def solve_until(asp_program, asp_facts, clingo_args, deadline, metrics=None,
+                optimal=False, limit=None):
+    # solve, or solve_optimal with optimal, stopped at the deadline. Clingo
+    # cannot interrupt grounding, so the search runs in its own process, which
+    # is terminated if it has not stopped by then, and also when the caller
+    # raises or gets SIGTERM. Pool workers cannot start processes and solve in
+    # their own. Returns the models and whether the search finished, a stopped
+    # optimization keeps the best model found when none was proven optimal yet
+    if optimal:
+        clingo_args = clingo_args + ["--opt-mode=optN"]
+    messages = []
+    proc = None
+    handler = False
+    if multiprocessing.current_process().daemon:
+        until_models(asp_program, asp_facts, clingo_args, deadline, optimal, limit, messages.append)
+    else:
+        recv, send = multiprocessing.Pipe(duplex=False)
+        proc = multiprocessing.Process(target=until_worker, args=(asp_program, asp_facts,
+                                       clingo_args, deadline, optimal, limit, send))
+        proc.start()
+        send.close()
+        # Only after the start, the search has to keep the default SIGTERM
+        # action, a Python handler would not run before its grounding ends
+        if threading.current_thread() is threading.main_thread():
+            handler = signal.signal(signal.SIGTERM, until_exit)
+    ret = []
+    best = None
+    finished = False
+    try:
+        while True:
+            if proc is None:
+                if len(messages) == 0:
+                    break
+                message = messages.pop(0)
+            else:
+                try:
+                    if not recv.poll(max(0.0, deadline + UNTIL_GRACE - time.time())):
+                        break
+                    message = recv.recv()
+                except EOFError:
+                    break
+            if message[0] == 'done':
+                finished = message[1]
+                if metrics is not None:
+                    metrics.solver_statistics(asp_program, message[2])
+                break
+            symbols = [ clingo.parse_term(sym) for sym in message[1] ]
+            if message[2]:
+                ret += [symbols]
+            else:
+                best = symbols
+    finally:
+        if proc is not None:
+            if proc.is_alive():
+                proc.terminate()
+            proc.join()
+            recv.close()
+        if handler is not False:
+            # None when the previous handler was not set from Python
+            signal.signal(signal.SIGTERM, signal.SIG_DFL if handler is None else handler)
+    if len(ret) == 0 and best is not None:
+        ret = [best]
+    return ret, finished
+
+class ModelSession:
+    # One grounded test_models Control for every program of a run, program pr
+    # goes to its own part and is switched on through the external active(pr)
+    def __init__(self, sigfacts, metrics=None):
+        self.control = new_control('test_models', [sigfacts], ["0"])
+        self.metrics = metrics
+
+    def models(self, program_facts, program_number):
+        number = clingo.Number(program_number)
+        part = "program_{0}".format(program_number)
+        self.control.add(part, [], program_facts)
+        self.control.ground([(part, []), ("check", [number])])
+        ret = []
+        active = clingo.Function("active", [number])
+        self.control.assign_external(active, True)
+        with self.control.solve(yield_=True) as handle:
+            for m in handle:
+                ret += [m.symbols(shown=True)]
+        if self.metrics is not None:
+            self.metrics.solver_statistics('test_models', control_statistics(self.control))
+        self.control.assign_external(active, False)
+        return ret
+
+class EquivSession:
+    # Strong equivalence against a base program as one query per program,
+    # the base program stays grounded in the same Control
+    def __init__(self, sigfacts, base_facts, base_number=1, metrics=None):
+        self.control = new_control('test_equiv', [sigfacts, base_facts], [])
+        self.metrics = metrics
+        self.base_number = clingo.Number(base_number)
+
+    def counterexample(self, program_facts, program_number):
+        # Symbols of an HT interpretation that is a model of only one of both
+        # programs, None if they are strongly equivalent
+        number = clingo.Number(program_number)
+        part = "program_{0}".format(program_number)
+        self.control.add(part, [], program_facts)
+        self.control.ground([(part, []), ("equiv", [self.base_number, number])])
+        active = clingo.Function("active", [self.base_number, number])
+        self.control.assign_external(active, True)
+        ret = None
+        with self.control.solve(yield_=True) as handle:
+            for m in handle:
+                ret = m.symbols(shown=True)
+                break
+        if self.metrics is not None:
+            self.metrics.solver_statistics('test_equiv', control_statistics(self.control))
+        self.control.assign_external(active, False)
+        return ret